@@ -1,9 +1,111 @@
 import math
+import os
 import random
-from numba import jit
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
 
 from MixtureModel import MixtureModel, MixtureModelWithModel
 
+# Number of Monte Carlo points evaluated at once by hellinger_distance.
+_MONTE_CARLO_BLOCK = 65536
+
+# Post-drift seeds are tried up to this offset for every pre-drift model.
+_MAX_CANDIDATE = 101
+
+# Pre-drift models tried before settling for the closest drift found.
+_MAX_PRE_DRIFT_RETRIES = 20
+
+
+def hellinger_distance(
+    mm1: MixtureModel,
+    mm2: MixtureModel,
+    target_dist: float,
+    integrate_range: float,
+    monte_carlo_seed: int,
+):
+    """
+    Estimate the Hellinger distance between two mixture models by Monte Carlo.
+
+    :param mm1: First mixture model.
+    :param mm2: Second mixture model.
+    :param target_dist: Distance the estimate is compared against to stop early.
+    :param integrate_range: Side length of the integration hypercube, centered on 0.
+    :param monte_carlo_seed: Seed of the Monte Carlo points.
+    """
+    num_atts = mm1.get_dimensions()
+    monte_carlo = 0.0
+    running_sum = 0.0
+    distance = -1.0
+
+    volume = math.pow(integrate_range, num_atts)
+    error = float("inf")
+    N = 0
+    mean = 0.0
+    M2 = 0.0
+    monte_carlo_random = np.random.RandomState(monte_carlo_seed)
+
+    while error > 0.001:
+        # Randomly generate a block of points at which to evaluate the function
+        points = (
+            monte_carlo_random.random_sample((_MONTE_CARLO_BLOCK, num_atts))
+            * integrate_range
+        ) - (integrate_range / 2.0)
+
+        # Evaluate the function at the points, sqrt(p1 * p2) in log space
+        x = np.exp(0.5 * (mm1.log_density_at_batch(points) + mm2.log_density_at_batch(points)))
+        running_sum += x.sum()
+
+        # Merge the block mean and variance into the running ones
+        block_mean = x.mean()
+        block_M2 = np.sum((x - block_mean) ** 2)
+        delta = block_mean - mean
+        total = N + len(x)
+        mean += delta * len(x) / total
+        M2 += block_M2 + delta**2 * N * len(x) / total
+        N = total
+        monte_carlo = volume * running_sum / N
+
+        # Once a sufficient base of samples has been built,
+        # calculate the sample variance and estimate the error
+        if N > 1000000:
+            sample_var = M2 / (N - 1)
+            error = volume * math.sqrt(sample_var) / math.sqrt(N)
+            distance = math.sqrt(max(0.0, 1.0 - monte_carlo))
+
+            # If the target distance is no longer within the error margin
+            # around the estimated distance then break from the WHILE loop
+            if abs(target_dist - distance) > (math.sqrt(error)):
+                break
+
+    # print("N: ", N, ", monte_carlo: ", monte_carlo, ", 1.0 - monte_carlo: ", (1.0-monte_carlo), ", and error: ", error)
+    # print("Hellinger distance is estimated as (", distance, " +/- ", math.sqrt(error), "); (target distance was ", target_dist, ")")
+    return distance
+
+
+def _evaluate_candidate(
+    mm_pre: MixtureModel,
+    num_classes_post,
+    num_atts,
+    instance_random_seed,
+    model_random_seed,
+    drift_magnitude,
+    integrate_range,
+    monte_carlo_seed,
+):
+    mm_post = MixtureModelWithModel(
+        num_classes_post,
+        num_atts,
+        instance_random_seed,
+        model_random_seed,
+        mm_pre,
+        drift_magnitude,
+    )
+    return hellinger_distance(
+        mm_pre, mm_post, drift_magnitude, integrate_range, monte_carlo_seed
+    )
+
 
 class ConceptMixtureModel:
     def __init__(
@@ -17,6 +119,8 @@ class ConceptMixtureModel:
         num_classes_post,
         model_random_seed,
         instance_random_seed,
+        n_jobs=None,
+        max_retries=_MAX_PRE_DRIFT_RETRIES,
     ):
         """
         :param num_atts: The number of attributes to generate.
@@ -28,6 +132,9 @@ class ConceptMixtureModel:
         :param num_classes_post: The number of classes in the data stream and the number of models to include in the mixture model post-concept drift.
         :param model_random_seed:  Seed for random generation of model.
         :param instance_random_seed: Seed for random generation of instances.
+        :param n_jobs: Number of processes evaluating post-drift candidates, all CPUs if None, in-process if 1.
+        :param max_retries: Number of pre-drift models tried. If none of them has a post-drift candidate within the
+            precision, the closest drift found is used and a warning is issued.
         """
         self.num_atts = num_atts
         self.num_classes_pre = num_classes_pre
@@ -38,9 +145,10 @@ class ConceptMixtureModel:
         self.precision_drift_magnitude = precision_drift_magnitude
         self.num_classes_post = num_classes_post
         self.model_random_seed = model_random_seed
+        self.n_jobs = n_jobs
+        self.max_retries = max_retries
         self._initialize()
 
-    @jit
     def _initialize(self):
         print("Initialized...")
         self._num_instances = 0
@@ -48,50 +156,44 @@ class ConceptMixtureModel:
         self._first_instance_post = self._last_instance_pre + self.drift_duration + 1
         self._monte_carlo_random = random.Random()
         self._integrate_range = max(self.num_classes_pre, self.num_classes_pre) + 4.0
-        y = 0
+        best = None
 
-        while True:
-            self._mixture_model_pre = MixtureModel(
-                self.num_classes_pre,
-                self.num_atts,
-                self.instance_random_seed + y,
-                self.model_random_seed + y,
-            )
-            y += 1
-            z = y
-
-            while True:
-                self._mixture_model_post = MixtureModelWithModel(
-                    self.num_classes_post,
-                    self.num_atts,
-                    self.instance_random_seed + z,
-                    self.model_random_seed + z,
-                    self._mixture_model_pre,
-                    self.drift_magnitude,
-                )
-                h_dist = self._hellinger_distance(
-                    self._mixture_model_pre,
-                    self._mixture_model_post,
-                    self.drift_magnitude,
+        executor = None
+        if self.n_jobs != 1:
+            executor = ProcessPoolExecutor(max_workers=self.n_jobs or os.cpu_count())
+
+        try:
+            for y in range(1, self.max_retries + 1):
+                self._mixture_model_pre = self._pre_drift_model(y - 1)
+                z, h_dist = self._search_post_candidates(
+                    y - 1, range(y, max(y, _MAX_CANDIDATE) + 1), executor
                 )
                 dist_miss = h_dist - self.drift_magnitude
-                print(
-                    "{}.{}: The Hellinger distance was evaluated as {},compared against the desired range {} +/- {}".format(
-                        y - 1,
-                        z - 1,
-                        h_dist,
-                        self.drift_magnitude,
-                        self.precision_drift_magnitude,
-                    )
-                )
-
-                if (z <= 100) and (abs(dist_miss) > self.precision_drift_magnitude):
-                    z += 1
-                else:
+                if best is None or abs(dist_miss) < abs(best[2] - self.drift_magnitude):
+                    best = (y - 1, z, h_dist)
+                if abs(dist_miss) <= self.precision_drift_magnitude:
                     break
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
-            if abs(dist_miss) > self.precision_drift_magnitude:
-                break
+        y, z, h_dist = best
+        dist_miss = h_dist - self.drift_magnitude
+        if abs(dist_miss) > self.precision_drift_magnitude:
+            warnings.warn(
+                "No drift within {} of {} after {} pre-drift models, using the closest one at {}.".format(
+                    self.precision_drift_magnitude, self.drift_magnitude, self.max_retries, h_dist
+                )
+            )
+        self._mixture_model_pre = self._pre_drift_model(y)
+        self._mixture_model_post = MixtureModelWithModel(
+            self.num_classes_post,
+            self.num_atts,
+            self.instance_random_seed + z,
+            self.model_random_seed + z,
+            self._mixture_model_pre,
+            self.drift_magnitude,
+        )
 
         print(
             "The Hellinger distance was evaluated as {}, compared against the desired range {} +/- {}".format(
@@ -101,6 +203,76 @@ class ConceptMixtureModel:
 
         print("The distance was off by {}".format(dist_miss))
 
+    def _pre_drift_model(self, y):
+        return MixtureModel(
+            self.num_classes_pre,
+            self.num_atts,
+            self.instance_random_seed + y,
+            self.model_random_seed + y,
+        )
+
+    def _search_post_candidates(self, y, candidates, executor):
+        """
+        Find the lowest post-drift seed offset within the drift precision.
+
+        Candidates are evaluated in parallel when an executor is given. The
+        search still returns the lowest matching index, and otherwise the last
+        candidate, so the result does not depend on the number of processes.
+        """
+        args = [
+            (
+                self._mixture_model_pre,
+                self.num_classes_post,
+                self.num_atts,
+                self.instance_random_seed + z,
+                self.model_random_seed + z,
+                self.drift_magnitude,
+                self._integrate_range,
+                self.instance_random_seed + self.model_random_seed,
+            )
+            for z in candidates
+        ]
+
+        results = {}
+        best = None
+        if executor is None:
+            for z, arg in zip(candidates, args):
+                results[z] = _evaluate_candidate(*arg)
+                self._report_candidate(y, z, results[z])
+                if abs(results[z] - self.drift_magnitude) <= self.precision_drift_magnitude:
+                    best = z
+                    break
+        else:
+            futures = {
+                executor.submit(_evaluate_candidate, *arg): z
+                for z, arg in zip(candidates, args)
+            }
+            for future in as_completed(futures):
+                z = futures[future]
+                results[z] = future.result()
+                self._report_candidate(y, z, results[z])
+                if abs(results[z] - self.drift_magnitude) <= self.precision_drift_magnitude:
+                    best = z if best is None else min(best, z)
+                if best is not None and all(c in results for c in candidates if c < best):
+                    break
+            for future in futures:
+                future.cancel()
+
+        if best is None:
+            best = candidates[-1]
+        return best, results[best]
+
+    def _report_candidate(self, y, z, h_dist):
+        print(
+            "{}.{}: The Hellinger distance was evaluated as {},compared against the desired range {} +/- {}".format(
+                y,
+                z - 1,
+                h_dist,
+                self.drift_magnitude,
+                self.precision_drift_magnitude,
+            )
+        )
+
     def next_instance(self):
         self._num_instances += 1
 
@@ -128,63 +300,17 @@ class ConceptMixtureModel:
             else:
                 return self._mixture_model_pre.next_instance()
 
-    @jit
     def _hellinger_distance(
         self, mm1: MixtureModel, mm2: MixtureModel, target_dist: float
     ):
-        monte_carlo = 0.0
-        running_sum = 0.0
-        hellinger_distance = -1.0
-
-        volume = math.pow(self._integrate_range, self.num_atts)
-        error = float("inf")
-        N = 0.0
-        sample_var = 0.0
-        mean = 0.0
-        M2 = 0.0
-        delta1 = 0.0
-        delta2 = 0.0
-        x = 0.0
-        point = [0.0] * self.num_atts
-        self._monte_carlo_random.seed(
-            self.instance_random_seed + self.model_random_seed
+        return hellinger_distance(
+            mm1,
+            mm2,
+            target_dist,
+            self._integrate_range,
+            self.instance_random_seed + self.model_random_seed,
         )
 
-        while error > 0.001:
-            # Randomly generate the point at which to evaluate the function
-            for i in range(self.num_atts):
-                point[i] = (
-                    self._monte_carlo_random.random() * self._integrate_range
-                ) - (self._integrate_range / 2.0)
-
-            # Evaluate the function at point and add the result to the running sum
-            x = math.sqrt(mm1.density_at(point) * mm2.density_at(point))
-            running_sum += x
-            N += 1
-
-            # Adjust other values of interest
-            delta1 = x - mean
-            mean += delta1 / N
-            delta2 = x - mean
-            M2 += delta1 * delta2
-            monte_carlo = volume * running_sum / N
-
-            # Once a sufficient base of samples has been built,
-            # calculate the sample variance and estimate the error
-            if N > 1000000:
-                sample_var = M2 / (N - 1)
-                error = volume * math.sqrt(sample_var) / math.sqrt(N)
-                hellinger_distance = math.sqrt(1.0 - monte_carlo)
-
-                # If the target distance is no longer within the error margin
-                # around the estimated distance then break from the WHILE loop
-                if abs(target_dist - hellinger_distance) > (math.sqrt(error)):
-                    break
-
-        # print("N: ", N, ", monte_carlo: ", monte_carlo, ", 1.0 - monte_carlo: ", (1.0-monte_carlo), ", and error: ", error)
-        # print("Hellinger distance is estimated as (", hellinger_distance, " +/- ", math.sqrt(error), "); (target distance was ", target_dist, ")")
-        return hellinger_distance
-
 
 if __name__ == "__main__":
     cmm = ConceptMixtureModel(
@@ -1,4 +1,6 @@
 import numpy as np
+from scipy.linalg import solve_triangular
+from scipy.special import logsumexp
 from scipy.stats import multivariate_normal
 import math
 
@@ -14,19 +16,19 @@ class MixtureModel:
         self.model_random = np.random.RandomState(model_random_seed)
         self.instance_random = np.random.RandomState(instance_random_seed)
         self.range = num_classes
+        self._cholesky_factors = None
+        self._density_factors = None
 
         self._initialize_models()
 
     def _initialize_models(self):
         weight_sum = 0
-        means = np.zeros(self.dimensions)
 
         for i in range(self.num_models):
             self.weights[i] = self.model_random.rand()
             weight_sum += self.weights[i]
 
-            for j in range(self.dimensions):
-                means[j] = (self.model_random.rand() * self.range) - (self.range / 2.0)
+            means = (self.model_random.rand(self.dimensions) * self.range) - (self.range / 2.0)
 
             covariances = self._generate_covariance(self.dimensions)
             self.model_array.append(multivariate_normal(means, covariances))
@@ -34,27 +36,11 @@ class MixtureModel:
         self._normalize_weights(weight_sum)
 
     def _generate_covariance(self, d):
-        x = np.random.rand(d, d)
-        covariances = np.zeros((d, d))
-        matrix_sum = 0
-
-        for j in range(d):
-            for k in range(d):
-                x[j][k] = (
-                    ((self.model_random.rand() * 2.0) - 1.0)
-                    + ((self.model_random.rand() * 2.0) - 1.0)
-                ) / 2.0
-
-        for j in range(d):
-            for k in range(j + 1):
-                for l in range(d):
-                    matrix_sum += x[j][l] * x[k][l]
-
-                covariances[j][k] = matrix_sum
-                covariances[k][j] = matrix_sum
-                matrix_sum = 0
-
-        return covariances
+        # Draws the same random sequence as filling x element by element,
+        # two uniforms per entry, and returns x x^T.
+        uniforms = (self.model_random.rand(d, d, 2) * 2.0) - 1.0
+        x = uniforms.sum(axis=2) / 2.0
+        return x @ x.T
 
     def _normalize_weights(self, weight_sum):
         for i in range(self.num_models):
@@ -66,13 +52,100 @@ class MixtureModel:
         y = index
         return point, y
 
-    def density_at(self, point):
-        density = 0
-
+    def _get_cholesky_factors(self):
+        if self._cholesky_factors is None:
+            self._cholesky_factors = [
+                self._sampling_factor(model.cov) for model in self.model_array
+            ]
+        return self._cholesky_factors
+
+    @staticmethod
+    def _sampling_factor(covariance):
+        # Falls back to an eigen decomposition for singular covariances,
+        # which scipy's multivariate_normal accepts as well.
+        try:
+            return np.linalg.cholesky(covariance)
+        except np.linalg.LinAlgError:
+            eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+            return eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+    def next_batch(self, n):
+        """
+        Draw ``n`` labelled points at once.
+
+        Component indices come from a single categorical draw and every
+        component's points are sampled in bulk through its Cholesky factor.
+        All randomness comes from ``instance_random``, so batches are
+        reproducible under ``instance_random_seed``.
+
+        :param n: Number of points to draw.
+        :return: Points of shape ``(n, dimensions)`` and their component indices.
+        """
+        y = self.instance_random.choice(self.num_models, size=n, p=self.weights)
+        points = self.instance_random.standard_normal((n, self.dimensions))
+
+        factors = self._get_cholesky_factors()
         for i in range(self.num_models):
-            density += self.weights[i] * self.model_array[i].pdf(point)
+            mask = y == i
+            points[mask] = points[mask] @ factors[i].T + self.model_array[i].mean
+
+        return points, y
+
+    def _get_density_factors(self):
+        # Cholesky factor and log normalizing constant of every component,
+        # None for singular covariances, which fall back to scipy.
+        if self._density_factors is None:
+            self._density_factors = []
+            for model in self.model_array:
+                try:
+                    factor = np.linalg.cholesky(model.cov)
+                except np.linalg.LinAlgError:
+                    self._density_factors.append(None)
+                    continue
+                log_norm = -0.5 * self.dimensions * math.log(2.0 * math.pi) - np.sum(
+                    np.log(np.diag(factor))
+                )
+                self._density_factors.append((factor, log_norm))
+        return self._density_factors
+
+    def log_density_at_batch(self, X):
+        """
+        Evaluate the log density of the mixture at every row of ``X``.
 
-        return density
+        Every component is evaluated through its precomputed Cholesky factor
+        and the components are combined with log-sum-exp.
+
+        :param X: Points of shape ``(n, dimensions)``.
+        :return: Log densities of shape ``(n,)``.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        log_densities = np.empty((self.num_models, X.shape[0]))
+
+        with np.errstate(divide="ignore"):
+            log_weights = np.log(self.weights)
+
+        for i, factors in enumerate(self._get_density_factors()):
+            if factors is None:
+                log_densities[i] = self.model_array[i].logpdf(X)
+            else:
+                factor, log_norm = factors
+                z = solve_triangular(factor, (X - self.model_array[i].mean).T, lower=True)
+                log_densities[i] = log_norm - 0.5 * np.einsum("ij,ij->j", z, z)
+            log_densities[i] += log_weights[i]
+
+        return logsumexp(log_densities, axis=0)
+
+    def density_at_batch(self, X):
+        """
+        Evaluate the density of the mixture at every row of ``X``.
+
+        :param X: Points of shape ``(n, dimensions)``.
+        :return: Densities of shape ``(n,)``.
+        """
+        return np.exp(self.log_density_at_batch(X))
+
+    def density_at(self, point):
+        return self.density_at_batch(np.reshape(point, (1, -1)))[0]
 
     def restart(self, instance_random_seed, model_random_seed):
         self.instance_random.seed(instance_random_seed)
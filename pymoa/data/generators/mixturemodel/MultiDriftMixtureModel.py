@@ -0,0 +1,141 @@
+from collections import namedtuple
+
+import numpy as np
+
+from MixtureModel import MixtureModel, MixtureModelWithModel
+
+# A drift towards concept ``concept`` starting at instance ``start``. During the
+# ``duration`` instances that follow, points come from the new concept with a
+# probability growing linearly from 0 to 1; ``duration=0`` is an abrupt drift and
+# drifting back to an earlier concept makes it recurring.
+Drift = namedtuple("Drift", ["start", "duration", "concept"])
+
+
+class MultiDriftMixtureModel:
+    def __init__(self, concepts, drifts, instance_random_seed):
+        """
+        :param concepts: Mixture models of the concepts, the stream starts with the first one.
+        :param drifts: Schedule of ``Drift``s, ordered by start and not overlapping.
+        :param instance_random_seed: Seed for choosing between concepts during gradual drifts.
+        """
+        self.concepts = list(concepts)
+        self.drifts = [Drift(*drift) for drift in drifts]
+        self.instance_random_seed = instance_random_seed
+        self.dimensions = self.concepts[0].get_dimensions()
+
+        end = 0
+        for drift in self.drifts:
+            if drift.start < end:
+                raise ValueError("Drifts must be ordered by start and must not overlap.")
+            if not 0 <= drift.concept < len(self.concepts):
+                raise ValueError("Drift towards unknown concept {}.".format(drift.concept))
+            end = drift.start + drift.duration
+
+        self._instance_random = np.random.RandomState(instance_random_seed)
+        self._num_instances = 0
+
+    @classmethod
+    def from_seeds(
+        cls,
+        num_atts,
+        num_classes,
+        num_concepts,
+        drift_magnitude,
+        drifts,
+        model_random_seed,
+        instance_random_seed,
+    ):
+        """
+        Build a scenario whose concepts each drift from the previous one.
+
+        :param num_atts: The number of attributes to generate.
+        :param num_classes: The number of classes of every concept.
+        :param num_concepts: The number of distinct concepts.
+        :param drift_magnitude: Magnitude of the drift between consecutive concepts. [0,1].
+        :param drifts: Schedule of ``Drift``s between the concepts.
+        :param model_random_seed: Seed for random generation of the models.
+        :param instance_random_seed: Seed for random generation of instances.
+        """
+        concepts = [
+            MixtureModel(num_classes, num_atts, instance_random_seed, model_random_seed)
+        ]
+        for i in range(1, num_concepts):
+            concepts.append(
+                MixtureModelWithModel(
+                    num_classes,
+                    num_atts,
+                    instance_random_seed + i,
+                    model_random_seed + i,
+                    concepts[-1],
+                    drift_magnitude,
+                )
+            )
+        return cls(concepts, drifts, instance_random_seed)
+
+    def _concepts_at(self, positions):
+        concepts = np.zeros(len(positions), dtype=np.int64)
+        uniforms = self._instance_random.random_sample(len(positions))
+        previous = 0
+
+        for drift in self.drifts:
+            after = positions >= drift.start + drift.duration
+            concepts[after] = drift.concept
+
+            if drift.duration > 0:
+                during = (positions >= drift.start) & ~after
+                probability = (positions[during] - drift.start + 1) / drift.duration
+                concepts[during] = np.where(
+                    uniforms[during] < probability, drift.concept, previous
+                )
+            previous = drift.concept
+
+        return concepts
+
+    def next_batch(self, n):
+        """
+        Draw the next ``n`` labelled points of the stream.
+
+        :param n: Number of points to draw.
+        :return: Points of shape ``(n, dimensions)``, their class indices and their concept indices.
+        """
+        positions = np.arange(self._num_instances, self._num_instances + n)
+        self._num_instances += n
+
+        concepts = self._concepts_at(positions)
+        points = np.empty((n, self.dimensions))
+        y = np.empty(n, dtype=np.int64)
+
+        for c in np.unique(concepts):
+            mask = concepts == c
+            points[mask], y[mask] = self.concepts[c].next_batch(int(mask.sum()))
+
+        return points, y, concepts
+
+    def write(self, path, n, block_size=1000000, dtype=np.float64):
+        """
+        Write ``n`` points of the stream into memory-mapped ``.npy`` files.
+
+        Points go to ``{path}_X.npy``, class indices to ``{path}_y.npy`` and
+        concept indices to ``{path}_concept.npy``. They are generated and
+        flushed ``block_size`` points at a time, so streams much larger than
+        memory can be written and later opened with ``np.load(mmap_mode="r")``.
+
+        :param path: Path prefix of the written files.
+        :param n: Number of points to write.
+        :param block_size: Number of points generated at once.
+        :param dtype: Data type of the stored points.
+        :return: Paths of the points, labels and concepts files.
+        """
+        paths = ("{}_X.npy".format(path), "{}_y.npy".format(path), "{}_concept.npy".format(path))
+        X = np.lib.format.open_memmap(paths[0], mode="w+", dtype=dtype, shape=(n, self.dimensions))
+        y = np.lib.format.open_memmap(paths[1], mode="w+", dtype=np.int64, shape=(n,))
+        concepts = np.lib.format.open_memmap(paths[2], mode="w+", dtype=np.int64, shape=(n,))
+
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            X[start:stop], y[start:stop], concepts[start:stop] = self.next_batch(stop - start)
+
+        for array in (X, y, concepts):
+            array.flush()
+        del X, y, concepts
+        return paths
@@ -11,81 +11,208 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import Any, Dict, Iterable, List
+import threading
+import weakref
+from typing import Any, Iterable
 
 import numpy as np
-import six
 from py4j.java_gateway import JavaGateway
-from py4j.java_gateway import java_import
-from sklearn import metrics
-import numpy as np
+from scipy import sparse
+
+from pymoa.utils.bridge import java_import
 
+# One CMM evaluator per gateway, CMM evaluations are not thread safe.
+_CMM_EVALUATORS = weakref.WeakKeyDictionary()
+_CMM_LOCK = threading.Lock()
 
-def get_contingency_matrix(y_true, y_pred):
+
+def get_contingency_matrix(y_true, y_pred, sample_weight=None, sparse_output=False):
     """
     Compute contingency matrix (also called confusion matrix),
     shape=[n_classes_true, n_classes_pred]
+
+    :param sample_weight: Optional weight of every sample, e.g. to fade out old
+        points of a stream. Counts are used when omitted.
+    :param sparse_output: Whether to return a ``scipy.sparse`` CSR matrix.
     """
-    contingency_matrix = metrics.cluster.contingency_matrix(y_true, y_pred)
-    return contingency_matrix
+    classes, class_idx = np.unique(y_true, return_inverse=True)
+    clusters, cluster_idx = np.unique(y_pred, return_inverse=True)
+    if sample_weight is None:
+        sample_weight = np.ones(class_idx.shape[0], dtype=np.int64)
 
+    contingency_matrix = sparse.coo_matrix(
+        (sample_weight, (class_idx, cluster_idx)),
+        shape=(classes.shape[0], clusters.shape[0]),
+    ).tocsr()
+    if sparse_output:
+        return contingency_matrix
+    return contingency_matrix.toarray()
 
-def purity_score(y_true, y_pred):
-    ctm = get_contingency_matrix(y_true, y_pred)
+
+def _check_contingency(y_true, y_pred, sample_weight, contingency):
+    """
+    Get the contingency matrix given or computed from the labels, as a COO
+    matrix with its row and column sums.
+    """
+    if contingency is None:
+        contingency = get_contingency_matrix(
+            y_true, y_pred, sample_weight=sample_weight, sparse_output=True
+        )
+    ctm = sparse.coo_matrix(contingency)
+    ctm.sum_duplicates()
+    ctm.eliminate_zeros()
+    row_sums = np.asarray(ctm.sum(axis=1), dtype=np.float64).ravel()
+    col_sums = np.asarray(ctm.sum(axis=0), dtype=np.float64).ravel()
+    return ctm, row_sums, col_sums
+
+
+def purity_score(y_true=None, y_pred=None, sample_weight=None, contingency=None):
+    """
+    :param contingency: Optional precomputed contingency matrix, dense or
+        sparse, used instead of the labels.
+    """
+    ctm, _, col_sums = _check_contingency(y_true, y_pred, sample_weight, contingency)
+    col_max = np.zeros(ctm.shape[1])
+    np.maximum.at(col_max, ctm.col, ctm.data)
     # return purity
-    return np.sum(np.amax(ctm, axis=0)) / np.sum(ctm)
+    return np.sum(col_max) / np.sum(col_sums)
 
 
-def F1_score_P(y_true, y_pred):
+def F1_score_P(y_true=None, y_pred=None, sample_weight=None, contingency=None):
     """
     F1 as defined in P3C, try using F1 optimization
+
+    Every cluster is matched with its majority class, the first one on ties.
+    Precision and recall of the match are ``n_ij / |cluster j|`` and
+    ``n_ij / |class i|``, so their F1 is ``2 n_ij / (|cluster j| + |class i|)``.
+    """
+    ctm, row_sums, col_sums = _check_contingency(y_true, y_pred, sample_weight, contingency)
+    num_rows, num_cols = ctm.shape
+
+    col_max = np.zeros(num_cols)
+    np.maximum.at(col_max, ctm.col, ctm.data)
+    majority = ctm.data == col_max[ctm.col]
+    max_index = np.full(num_cols, num_rows)
+    np.minimum.at(max_index, ctm.col[majority], ctm.row[majority])
+
+    matched = col_max > 0
+    f1 = np.zeros(num_cols)
+    f1[matched] = 2 * col_max[matched] / (col_sums[matched] + row_sums[max_index[matched]])
+    return np.sum(f1) / num_cols
+
+
+def F1_score_R(y_true=None, y_pred=None, sample_weight=None, contingency=None):
+    """
+    F1 as defined in .... mainly maximizes F1 for each class
+
+    Only the non-zero cells of the contingency matrix can have a non-zero F1,
+    so they are the only ones computed.
     """
-    ctm = get_contingency_matrix(y_true, y_pred)
+    ctm, row_sums, col_sums = _check_contingency(y_true, y_pred, sample_weight, contingency)
 
-    max_index = np.argmax(ctm, axis=0)
-    F1_P = 0.0
+    f1 = 2 * ctm.data / (row_sums[ctm.row] + col_sums[ctm.col])
+    max_f1 = np.zeros(ctm.shape[0])
+    np.maximum.at(max_f1, ctm.row, f1)
+    return np.sum(max_f1) / ctm.shape[0]
 
-    for j in range(ctm.shape[1]):
-        precision = ctm[max_index[j], j] / sum(ctm[:, j])
-        recall = ctm[max_index[j], j] / sum(ctm[max_index[j], :])
-        f1 = 0.0
-        if precision > 0 and recall > 0:
-            f1 = 2 * precision * recall / (precision + recall)
-        F1_P += f1
-    F1_P /= ctm.shape[1]
-    return F1_P
 
+def adjusted_rand_score(y_true=None, y_pred=None, sample_weight=None, contingency=None):
+    """
+    Adjusted Rand index, as ``sklearn.metrics.adjusted_rand_score``, computed
+    from the contingency matrix.
 
-def F1_score_R(y_true, y_pred):
+    It counts pairs of points, ``n (n - 1) / 2`` per cell, which only makes
+    sense for whole counts: fractional weights, e.g. faded ones, are rejected.
+    """
+    ctm, row_sums, col_sums = _check_contingency(y_true, y_pred, sample_weight, contingency)
+    if not np.array_equal(ctm.data, np.round(ctm.data)):
+        raise ValueError("The adjusted Rand index needs whole counts, not fractional weights.")
+    n = np.sum(row_sums)
+    if n * (n - 1) <= 0:
+        return 1.0
+
+    sum_pairs = np.sum(ctm.data * (ctm.data - 1)) / 2
+    sum_class_pairs = np.sum(row_sums * (row_sums - 1)) / 2
+    sum_cluster_pairs = np.sum(col_sums * (col_sums - 1)) / 2
+    expected = sum_class_pairs * sum_cluster_pairs / (n * (n - 1) / 2)
+    maximum = (sum_class_pairs + sum_cluster_pairs) / 2
+    if np.isclose(maximum, expected):
+        return 1.0
+    return (sum_pairs - expected) / (maximum - expected)
+
+
+def normalized_mutual_info_score(y_true=None, y_pred=None, sample_weight=None, contingency=None):
+    """
+    Normalized mutual information with arithmetic averaging, as
+    ``sklearn.metrics.normalized_mutual_info_score``, computed from the
+    contingency matrix so weighted counts are supported.
     """
-    F1 as defined in .... mainly maximizes F1 for each class"""
-    ctm = get_contingency_matrix(y_true, y_pred)
+    ctm, row_sums, col_sums = _check_contingency(y_true, y_pred, sample_weight, contingency)
+    n = np.sum(row_sums)
+
+    def entropy(sums):
+        p = sums[sums > 0] / n
+        return -np.sum(p * np.log(p))
+
+    class_entropy = entropy(row_sums)
+    cluster_entropy = entropy(col_sums)
+    if class_entropy == 0 and cluster_entropy == 0:
+        return 1.0
+
+    joint = ctm.data / n
+    outer = row_sums[ctm.row] * col_sums[ctm.col] / n**2
+    mutual_info = max(np.sum(joint * np.log(joint / outer)), 0.0)
+    return mutual_info / ((class_entropy + cluster_entropy) / 2)
+
 
-    F1_R = 0.0
-    for i in range(ctm.shape[0]):
-        max_f1 = 0.0
-        for j in range(ctm.shape[1]):
-            precision = ctm[i, j] / sum(ctm[:, j])
-            recall = ctm[i, j] / sum(ctm[i, :])
-            f1 = 0.0
-            if precision > 0 and recall > 0:
-                f1 = 2 * precision * recall / (precision + recall)
-            if f1 > max_f1:
-                max_f1 = f1
-        F1_R += max_f1
-    F1_R /= ctm.shape[0]
+def _get_cmm_evaluator(gateway: JavaGateway):
+    """Get the CMM evaluator of a gateway and the names of its measures."""
+    evaluator = _CMM_EVALUATORS.get(gateway)
+    if evaluator is None:
+        java_import(gateway, "moa.evaluation.CMM")
+        cmm = gateway.jvm.CMM()
+        names = [cmm.getName(i) for i in range(cmm.getNumMeasures())]
+        evaluator = (cmm, names)
+        _CMM_EVALUATORS[gateway] = evaluator
+    return evaluator
 
-    return F1_R
+
+def to_data_points(gateway: JavaGateway, instances: Iterable[Any], timestamps: Iterable[int]):
+    """
+    Wrap labelled MOA instances into the ``DataPoint``s CMM evaluates.
+
+    :param instances: Instances whose class is the ground truth.
+    :param timestamps: Arrival time of every instance.
+    :return: A Java ``ArrayList`` of ``DataPoint``s.
+    """
+    DataPoint = gateway.jvm.moa.gui.visualization.DataPoint
+    points = gateway.jvm.java.util.ArrayList()
+    for instance, timestamp in zip(instances, timestamps):
+        points.add(DataPoint(instance, int(timestamp)))
+    return points
 
 
 def cmm_score(gateway: JavaGateway, clustering, gt_clustering, points: Iterable[float]):
-    cmm_path = "moa.evaluation.CMM"
-    java_import(gateway.jvm, cmm_path)
-    cmm = gateway.jvm.CMM()
-    cmm.evaluateClustering(clustering, gt_clustering, points)
-    cmm_score = {}
-    for i in range(cmm.getNumMeasures()):
-        cmm_score[cmm.getName(i)] = cmm.getAllValues(i)
+    """
+    Evaluate a clustering with MOA's CMM.
+
+    The evaluator is created once per gateway and reused.
+
+    :param clustering: The ``moa.cluster.Clustering`` to evaluate.
+    :param gt_clustering: The ground truth clustering, or None to build it
+        from the classes of ``points``.
+    :param points: A Java ``ArrayList`` of ``DataPoint``, see :func:`to_data_points`.
+    :return: The value of every CMM measure, keyed by name.
+    """
+    if gt_clustering is None:
+        gt_clustering = gateway.jvm.moa.cluster.Clustering(points)
+
+    with _CMM_LOCK:
+        cmm, names = _get_cmm_evaluator(gateway)
+        cmm.evaluateClustering(clustering, gt_clustering, points)
+        cmm_score = {}
+        for i, name in enumerate(names):
+            cmm_score[name] = cmm.getLastValue(i)
     return cmm_score
 
 
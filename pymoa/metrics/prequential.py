@@ -0,0 +1,170 @@
+# Copyright 2023 Xin Han
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator
+
+import numpy as np
+from scipy import sparse
+
+from pymoa.metrics.streaming import ReservoirSample, StreamingClusteringMetrics
+from pymoa.models.clustering.base import _iter_chunks
+
+_WINDOWS = ("sliding", "fading")
+
+
+class PrequentialEvaluator:
+    """
+    Test-then-train evaluation of a clusterer over a stream.
+
+    Every chunk of the stream is first predicted with the current model, then
+    learned. Quality is measured over the most recent ``window_size`` points
+    (``"sliding"``) or over every point faded out with age by
+    ``fading_factor`` per point (``"fading"``). Metrics are kept up to date
+    incrementally, so neither the stream nor the labels of a fading window are
+    stored however long the stream is.
+    """
+
+    def __init__(
+        self,
+        estimator: Any,
+        chunk_size: int = 1000,
+        window: str = "sliding",
+        window_size: int = 10000,
+        fading_factor: float = 0.999,
+        cmm: bool = False,
+        cmm_sample_size: int = None,
+        random_seed: int = None,
+    ) -> None:
+        """
+        Initialize evaluator.
+
+        :param estimator: The clusterer, e.g. a ``BaseClustering``, providing
+            ``predict_batch`` and ``learn_batch``.
+        :param chunk_size: Number of points predicted and learned at a time.
+        :param window: ``"sliding"`` or ``"fading"``.
+        :param window_size: Number of most recent points the metrics of the
+            sliding window, and CMM, cover.
+        :param fading_factor: Weight decay per point of the fading window. (0,1].
+        :param cmm: Whether to also evaluate CMM over the window, see
+            ``BaseClustering.evaluate_cmm``.
+        :param cmm_sample_size: Optional size of a reservoir sample CMM is
+            evaluated on instead of every point of the window, so CMM costs
+            the same however large the window. The sampled window tumbles
+            every ``window_size`` points rather than sliding.
+        :param random_seed: Seed of the CMM sample.
+        """
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size must be at least 1, got {chunk_size}.")
+        if window not in _WINDOWS:
+            raise ValueError(f"window must be one of {_WINDOWS}, got {window!r}.")
+        if window_size < 1:
+            raise ValueError(f"window_size must be at least 1, got {window_size}.")
+        if not 0 < fading_factor <= 1:
+            raise ValueError(f"fading_factor must be in (0, 1], got {fading_factor}.")
+
+        self._estimator = estimator
+        self._chunk_size = chunk_size
+        self._window = window
+        self._window_size = window_size
+        self._fading_factor = fading_factor
+        self._cmm = cmm
+        self._cmm_sample_size = cmm_sample_size
+        self._random_seed = random_seed
+
+    @property
+    def estimator(self) -> Any:
+        return self._estimator
+
+    def evaluate(
+        self, X: Iterable[Iterable[float]], lables: Iterable[int]
+    ) -> Iterator[Dict[str, float]]:
+        """
+        Run the stream through the estimator, test-then-train.
+
+        :param X: A 2-D array, a ``scipy.sparse`` matrix or an iterable of vectors.
+        :param lables: Class of every vector, consumed alongside ``X``.
+        :return: A generator of one report per chunk, holding the number of
+            ``instances`` seen, the total weight of the ``window``, i.e. its
+            number of points when sliding, the window's ``purity``, ``F1_P``,
+            ``F1_R``, ``NMI``, ``ARI`` when sliding and optionally ``cmm``, the chunk's
+            ``throughput`` in points per second, and its mean
+            ``predict_latency`` and ``learn_latency`` per point in seconds.
+        """
+        metrics = StreamingClusteringMetrics(
+            window_size=self._window_size if self._window == "sliding" else None,
+            fading_factor=self._fading_factor if self._window == "fading" else None,
+        )
+        window = deque()
+        window_length = 0
+        reservoir = None
+        if self._cmm and self._cmm_sample_size is not None:
+            reservoir = ReservoirSample(self._cmm_sample_size, random_seed=self._random_seed)
+        seen = 0
+
+        for X_chunk, y_chunk in _iter_chunks(X, lables, self._chunk_size):
+            if not sparse.issparse(X_chunk):
+                X_chunk = np.asarray(X_chunk, dtype=np.float64)
+            y_chunk = np.asarray(y_chunk, dtype=np.int64)
+            num_points = X_chunk.shape[0]
+
+            start_time = time.perf_counter()
+            y_pred = np.asarray(self._estimator.predict_batch(X_chunk), dtype=np.int64)
+            predict_time = time.perf_counter() - start_time
+
+            report = metrics.update(y_chunk, y_pred).scores()
+            report["window"] = metrics.weight
+            if reservoir is not None:
+                if reservoir.num_seen >= self._window_size:
+                    reservoir.reset()
+                reservoir.update(X_chunk, y_chunk, np.arange(seen, seen + num_points))
+                scores = self._estimator.evaluate_cmm(
+                    reservoir.X, reservoir.y, timestamps=reservoir.timestamps
+                )
+                report["cmm"] = scores.get("CMM", np.nan)
+            elif self._cmm:
+                window.append((X_chunk, y_chunk, np.arange(seen, seen + num_points)))
+                window_length += num_points
+                while window_length - window[0][1].shape[0] >= self._window_size:
+                    window_length -= window.popleft()[1].shape[0]
+                report["cmm"] = self._window_cmm(window, window_length)
+
+            start_time = time.perf_counter()
+            # Classes are only for evaluation, learning them would leak them.
+            self._estimator.learn_batch(X_chunk)
+            learn_time = time.perf_counter() - start_time
+
+            seen += num_points
+            report.update(
+                instances=seen,
+                throughput=num_points / max(predict_time + learn_time, 1e-12),
+                predict_latency=predict_time / num_points,
+                learn_latency=learn_time / num_points,
+            )
+            yield report
+
+    def _window_cmm(self, window: deque, window_length: int) -> float:
+        """Evaluate CMM over the points of the window."""
+        # The oldest chunk may stick out of the window, cut it at window_size.
+        skip = max(window_length - self._window_size, 0)
+        chunks = [chunk[0] for chunk in window]
+        if sparse.issparse(chunks[0]):
+            X_window = sparse.vstack(chunks, format="csr")[skip:]
+        else:
+            X_window = np.concatenate(chunks)[skip:]
+        y_window = np.concatenate([chunk[1] for chunk in window])[skip:]
+        timestamps = np.concatenate([chunk[2] for chunk in window])[skip:]
+
+        scores = self._estimator.evaluate_cmm(X_window, y_window, timestamps=timestamps)
+        return scores.get("CMM", np.nan)
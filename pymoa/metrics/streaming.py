@@ -0,0 +1,305 @@
+# Copyright 2023 Xin Han
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import math
+from collections import deque
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from pymoa.metrics.metrics import (
+    F1_score_P,
+    F1_score_R,
+    adjusted_rand_score,
+    normalized_mutual_info_score,
+    purity_score,
+)
+
+# Decayed weights are stored divided by a running scale. Once the scale gets
+# this small, it is folded back into the weights to stay clear of underflow.
+_MIN_SCALE = 1e-100
+# Cells whose weight has decayed below this are dropped from the matrix.
+_MIN_WEIGHT = 1e-12
+
+
+class StreamingClusteringMetrics:
+    """
+    Clustering quality of a stream, from an incrementally updated sparse
+    contingency matrix.
+
+    Updates cost a pass over the new labels and queries cost
+    O(classes x clusters), however many points have been seen. By default
+    every point counts; alternatively only the last ``window_size`` points do,
+    or the weight of every point fades by ``fading_factor`` per newer point.
+    """
+
+    def __init__(self, window_size: int = None, fading_factor: float = None) -> None:
+        """
+        Initialize metrics.
+
+        :param window_size: Optional number of most recent points to cover.
+        :param fading_factor: Optional weight decay per point. (0,1].
+        """
+        if window_size is not None and fading_factor is not None:
+            raise ValueError("Use either window_size or fading_factor, not both.")
+        if window_size is not None and window_size < 1:
+            raise ValueError(f"window_size must be at least 1, got {window_size}.")
+        if fading_factor is not None and not 0 < fading_factor <= 1:
+            raise ValueError(f"fading_factor must be in (0, 1], got {fading_factor}.")
+
+        self._window_size = window_size
+        self._fading_factor = fading_factor
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget every point seen."""
+        self._classes: Dict[int, int] = {}
+        self._clusters: Dict[int, int] = {}
+        self._cells: Dict[Tuple[int, int], float] = {}
+        self._scale = 1.0
+        self._window = deque()
+        self._window_length = 0
+        self._num_seen = 0
+
+    @property
+    def num_seen(self) -> int:
+        return self._num_seen
+
+    @property
+    def weight(self) -> float:
+        """Total weight of the points covered, their number without fading."""
+        return sum(self._cells.values()) * self._scale
+
+    def _index(self, labels: np.ndarray, mapping: Dict[int, int]) -> np.ndarray:
+        """Map labels to rows or columns, adding unseen ones."""
+        uniques, inverse = np.unique(labels, return_inverse=True)
+        indices = np.empty(uniques.shape[0], dtype=np.int64)
+        for i, label in enumerate(uniques.tolist()):
+            indices[i] = mapping.setdefault(label, len(mapping))
+        return indices[inverse]
+
+    def _add(self, y_true: np.ndarray, y_pred: np.ndarray, weights: np.ndarray) -> None:
+        """Add weights to the cells of the labels, aggregated per cell."""
+        rows = self._index(y_true, self._classes)
+        cols = self._index(y_pred, self._clusters)
+        num_cols = max(len(self._clusters), 1)
+        cells, inverse = np.unique(rows * num_cols + cols, return_inverse=True)
+        sums = np.bincount(inverse, weights=weights)
+
+        for cell, value in zip(cells.tolist(), sums.tolist()):
+            key = divmod(cell, num_cols)
+            total = self._cells.get(key, 0.0) + value
+            if total > _MIN_WEIGHT / self._scale:
+                self._cells[key] = total
+            else:
+                self._cells.pop(key, None)
+
+    def _fade(self, y_true: np.ndarray, y_pred: np.ndarray) -> None:
+        """Fade every point by the new ones and add them."""
+        num_points = y_true.shape[0]
+        decay = self._fading_factor**num_points
+        if self._scale * decay < _MIN_SCALE:
+            # Fold the scale back into the weights before it gets any smaller.
+            self._cells = {
+                key: value * self._scale
+                for key, value in self._cells.items()
+                if value * self._scale > _MIN_WEIGHT
+            }
+            self._scale = 1.0
+        # Older points shrink by multiplying the scale, instead of touching
+        # every cell, and the new ones are stored relative to it.
+        self._scale *= decay
+        ages = np.arange(num_points - 1, -1, -1)
+        self._add(y_true, y_pred, self._fading_factor**ages / self._scale)
+
+    def update(self, y_true: Iterable[int], y_pred: Iterable[int]) -> "StreamingClusteringMetrics":
+        """
+        Add newly labelled points, in stream order.
+
+        :param y_true: Class of every point.
+        :param y_pred: Cluster of every point.
+        """
+        y_true = np.asarray(y_true, dtype=np.int64).ravel()
+        y_pred = np.asarray(y_pred, dtype=np.int64).ravel()
+        if y_true.shape != y_pred.shape:
+            raise ValueError("y_true and y_pred must have the same length.")
+        num_points = y_true.shape[0]
+        if num_points == 0:
+            return self
+        self._num_seen += num_points
+
+        if self._fading_factor is not None:
+            # Decay at most to _MIN_SCALE per step, so neither the scale nor
+            # the weights of the newest points underflow, however large the chunk.
+            step = num_points
+            if self._fading_factor < 1:
+                step = max(int(math.log(_MIN_SCALE) / math.log(self._fading_factor)), 1)
+            for start in range(0, num_points, step):
+                self._fade(y_true[start:start + step], y_pred[start:start + step])
+            return self
+
+        self._add(y_true, y_pred, np.ones(num_points))
+        if self._window_size is None:
+            return self
+
+        self._window.append((y_true, y_pred))
+        self._window_length += num_points
+        while self._window_length > self._window_size:
+            old_true, old_pred = self._window.popleft()
+            excess = self._window_length - self._window_size
+            if excess < old_true.shape[0]:
+                self._window.appendleft((old_true[excess:], old_pred[excess:]))
+                old_true, old_pred = old_true[:excess], old_pred[:excess]
+            self._add(old_true, old_pred, -np.ones(old_true.shape[0]))
+            self._window_length -= old_true.shape[0]
+        return self
+
+    def contingency_matrix(self) -> sparse.csr_matrix:
+        """
+        Get the contingency matrix, shape=[n_classes_true, n_classes_pred].
+
+        Classes and clusters are only kept while some covered point has them.
+        """
+        if not self._cells:
+            return sparse.csr_matrix((0, 0))
+
+        rows, cols = zip(*self._cells.keys())
+        rows = np.asarray(rows)
+        cols = np.asarray(cols)
+        values = np.fromiter(self._cells.values(), dtype=np.float64, count=len(self._cells))
+        # Drop the classes and clusters that left the window.
+        used_rows, rows = np.unique(rows, return_inverse=True)
+        used_cols, cols = np.unique(cols, return_inverse=True)
+        return sparse.csr_matrix(
+            (values * self._scale, (rows, cols)), shape=(used_rows.shape[0], used_cols.shape[0])
+        )
+
+    def purity(self) -> float:
+        return purity_score(contingency=self.contingency_matrix())
+
+    def F1_P(self) -> float:
+        return F1_score_P(contingency=self.contingency_matrix())
+
+    def F1_R(self) -> float:
+        return F1_score_R(contingency=self.contingency_matrix())
+
+    def adjusted_rand(self) -> float:
+        """Adjusted Rand index, only without fading, see :func:`adjusted_rand_score`."""
+        if self._fading_factor is not None:
+            raise ValueError("The adjusted Rand index is undefined for faded weights.")
+        return adjusted_rand_score(contingency=self.contingency_matrix())
+
+    def normalized_mutual_info(self) -> float:
+        return normalized_mutual_info_score(contingency=self.contingency_matrix())
+
+    def scores(self) -> Dict[str, float]:
+        """
+        Get every metric at once, building the contingency matrix only once.
+
+        ``ARI`` is left out when fading, see :meth:`adjusted_rand`.
+        """
+        ctm = self.contingency_matrix()
+        if ctm.shape[0] == 0:
+            return {}
+        scores = {
+            "purity": purity_score(contingency=ctm),
+            "F1_P": F1_score_P(contingency=ctm),
+            "F1_R": F1_score_R(contingency=ctm),
+        }
+        if self._fading_factor is None:
+            scores["ARI"] = adjusted_rand_score(contingency=ctm)
+        scores["NMI"] = normalized_mutual_info_score(contingency=ctm)
+        return scores
+
+
+class ReservoirSample:
+    """
+    Uniform sample of at most ``capacity`` labelled points of a stream.
+
+    Algorithm R: the ``t``-th point replaces a random sampled one with
+    probability ``capacity / t``, so memory and the cost of evaluating on the
+    sample stay bounded however many points are seen.
+    """
+
+    def __init__(self, capacity: int, random_seed: int = None) -> None:
+        """
+        Initialize sample.
+
+        :param capacity: Maximum number of sampled points.
+        :param random_seed: Seed for choosing the sampled points.
+        """
+        if capacity < 1:
+            raise ValueError(f"capacity must be at least 1, got {capacity}.")
+        self._capacity = capacity
+        self._random = np.random.RandomState(random_seed)
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget every point seen."""
+        self._X = None
+        self._y = np.empty(self._capacity, dtype=np.int64)
+        self._timestamps = np.empty(self._capacity, dtype=np.int64)
+        self._num_seen = 0
+
+    @property
+    def num_seen(self) -> int:
+        return self._num_seen
+
+    def __len__(self) -> int:
+        return min(self._num_seen, self._capacity)
+
+    @property
+    def X(self) -> np.ndarray:
+        return self._X[:len(self)]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self._y[:len(self)]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[:len(self)]
+
+    def update(self, X: np.ndarray, y: Iterable[int], timestamps: Iterable[int]) -> "ReservoirSample":
+        """
+        Offer new points, in stream order.
+
+        :param X: A 2-D array or a ``scipy.sparse`` matrix of the points.
+        :param y: Class of every point.
+        :param timestamps: Arrival time of every point.
+        """
+        y = np.asarray(y, dtype=np.int64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        num_points = y.shape[0]
+        if self._X is None:
+            self._X = np.empty((self._capacity, X.shape[1]))
+
+        # Point t (0-based) takes slot j, drawn in [0, t], when j < capacity.
+        positions = np.arange(self._num_seen, self._num_seen + num_points)
+        slots = np.where(
+            positions < self._capacity,
+            positions,
+            np.floor(self._random.random_sample(num_points) * (positions + 1)).astype(np.int64),
+        )
+        chosen = np.flatnonzero(slots < self._capacity)
+        # Among points taking the same slot, the last one wins.
+        _, last = np.unique(slots[chosen][::-1], return_index=True)
+        chosen = chosen[::-1][last]
+
+        rows = X[chosen]
+        self._X[slots[chosen]] = rows.toarray() if sparse.issparse(rows) else rows
+        self._y[slots[chosen]] = y[chosen]
+        self._timestamps[slots[chosen]] = timestamps[chosen]
+        self._num_seen += num_points
+        return self
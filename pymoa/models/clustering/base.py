@@ -13,14 +13,35 @@
 # limitations under the License.
 
 import abc
-from typing import Any, Dict, Iterable, List
+import importlib
+import json
+import logging
+import os
+import threading
+import weakref
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
 import numpy as np
 
 import six
-from py4j.java_gateway import JavaGateway, JavaObject
+from py4j.java_gateway import JavaGateway
+from scipy import sparse
 from sklearn.base import BaseEstimator, ClusterMixin
 import time
 
+from pymoa.metrics.metrics import cmm_score, to_data_points
+from pymoa.utils.dependencies import _CLUSTERING_JARS
+from pymoa.utils.bridge import JPypeGateway, is_java_object
+from pymoa.utils.instrumentation import Instrumentation
+from pymoa.utils.utils import (
+    acquire_java_gateway,
+    build_java_options,
+    release_java_gateway,
+    track_java_objects,
+)
+
+from .snapshot import ClusteringSnapshot, export_clusters
+
 _IMPORTS = [
     "com.yahoo.labs.samoa.instances.SparseInstance",
     "com.yahoo.labs.samoa.instances.DenseInstance",
@@ -33,8 +54,86 @@ _IMPORTS = [
     "moa.clusterers.KMeans",
     "moa.gui.visualization.DataPoint",
     "moa.cluster.Clustering",
+    "java.nio.ByteBuffer",
+    "java.nio.ByteOrder",
+    "java.nio.IntBuffer",
+    "java.util.Arrays",
+    "java.io.ByteArrayInputStream",
+    "java.io.ByteArrayOutputStream",
+    "java.io.ObjectInputStream",
+    "java.io.ObjectOutputStream",
+    "java.awt.image.BandedSampleModel",
+    "java.awt.image.DataBuffer",
+    "java.awt.image.DataBufferByte",
+    "java.awt.image.DataBufferFloat",
+    "java.awt.image.DataBufferShort",
+    "java.awt.image.Raster",
+    "Jama.Matrix",
 ]
 
+# Wire formats of dense blocks: little-endian dtype of the values and, for
+# quantized formats, the range of the codes. Bytes are unsigned on the JVM
+# side, so 8-bit codes run from 0 to 255.
+_WIRE_DTYPES = {
+    "float64": ("<f8", None),
+    "float32": ("<f4", None),
+    "int16": ("<i2", (-32768, 32767)),
+    "int8": ("u1", (0, 255)),
+}
+# Quantized blocks are rescaled on the JVM this many points at a time, which
+# bounds the size of the cached scale and offset matrices.
+_DEQUANTIZE_BLOCK = 1024
+# Input crosses the bridge in blocks of at most this many bytes, so neither
+# the Py4J command nor the arrays unpacked on the JVM grow with the input.
+_TRANSFER_BYTES = 1 << 24
+
+_JARS = _CLUSTERING_JARS
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _iter_chunks(
+    X: Iterable[Iterable[float]], lables: Iterable[int], chunk_size: int
+) -> Iterator[Tuple[Any, Any]]:
+    """Split vectors, and their labels if any, into chunks of ``chunk_size``."""
+    if isinstance(X, np.ndarray) or sparse.issparse(X):
+        for start in range(0, X.shape[0], chunk_size):
+            y = None if lables is None else lables[start:start + chunk_size]
+            yield X[start:start + chunk_size], y
+        return
+
+    vectors = iter(X)
+    labels = None if lables is None else iter(lables)
+    while True:
+        chunk = list(islice(vectors, chunk_size))
+        if not chunk:
+            return
+        y = None if labels is None else list(islice(labels, len(chunk)))
+        yield chunk, y
+
+
+def _run_background_refresh(
+    estimator_ref: weakref.ref, wakeup: threading.Event, stop: threading.Event
+) -> None:
+    """Refresh loop of the background thread, holding the estimator weakly."""
+    while True:
+        requested = wakeup.wait(timeout=1.0)
+        wakeup.clear()
+        if stop.is_set():
+            return
+
+        estimator = estimator_ref()
+        if estimator is None:
+            return
+        if not requested:
+            del estimator
+            continue
+        try:
+            estimator._refresh_in_background()
+        except Exception:  # noqa
+            _LOGGER.exception("Background clustering refresh failed.")
+        del estimator
+
 
 @six.add_metaclass(abc.ABCMeta)
 class BaseClustering(BaseEstimator, ClusterMixin):
@@ -56,6 +155,14 @@ class BaseClustering(BaseEstimator, ClusterMixin):
         self._num_classes = num_classes
 
         self._gateway: JavaGateway = None
+        self._java_imports: List[str] = _IMPORTS
+        self._java_jars: List[str] = _JARS
+        # Whether the MOA clusterer reads instances by attribute index, so
+        # sparse input can stay sparse. Clusterers sizing their kernels with
+        # numValues(), the number of stored values, need dense instances.
+        self._sparse_instances = False
+        self._finalizer: weakref.finalize = None
+        self._clusterer_state: bytes = None
 
         self._header: Any = None
         self._clusterer: Any = None
@@ -63,12 +170,33 @@ class BaseClustering(BaseEstimator, ClusterMixin):
         self._found_clustering: Any = None
         self._m_timestamp = 0
         self._last_instance: Any = None
+        self._local_predict = False
+        self._snapshot: ClusteringSnapshot = None
+        self._instrumentation: Instrumentation = None
+        self._refresh_every_n: int = 1
+        self._refresh_interval: float = None
+        self._points_since_refresh = 0
+        self._last_refresh = 0.0
+        self._clusterer_lock = threading.RLock()
+        self._refresh_thread: threading.Thread = None
+        self._refresh_wakeup: threading.Event = None
+        self._refresh_stop: threading.Event = None
+        self._wire_dtype = "float64"
+        self._wire_scale: np.ndarray = None
+        self._wire_offset: np.ndarray = None
+        self._wire_factors: Dict[int, Tuple[Any, Any]] = {}
+        self._java_options: List[str] = None
 
     @property
     def dimension(self) -> float:
         """Get data dimentions."""
         return self._dimensions
 
+    @property
+    def dimensions(self) -> int:
+        """Get data dimentions."""
+        return self._dimensions
+
     @property
     def num_classes(self) -> float:
         """Get classes number."""
@@ -90,6 +218,208 @@ class BaseClustering(BaseEstimator, ClusterMixin):
     def last_instance(self) -> Any:
         return self._last_instance
 
+    @property
+    def local_predict(self) -> bool:
+        """Whether predictions are computed locally from a clustering snapshot."""
+        return self._local_predict
+
+    def enable_local_predict(self, enabled: bool = True):
+        """
+        Predict from a local snapshot of the clustering instead of the JVM.
+
+        Centers, radii and weights are copied once per clustering and every
+        point is then assigned with vectorized NumPy code. Inclusion uses the
+        spherical test of ``SphereCluster``, which is what the offline
+        k-means and DBSCAN clusterings are made of; clusterers with their own
+        inclusion test (e.g. D-Stream grid clusters) should keep the default.
+
+        :param enabled: Turn local prediction on or off.
+        """
+        self._local_predict = enabled
+        self._snapshot = None
+        return self
+
+    def set_java_options(
+        self,
+        max_heap: str = None,
+        initial_heap: str = None,
+        gc: str = None,
+        jit_options: Iterable[str] = (),
+        options: Iterable[str] = (),
+    ):
+        """
+        Tune the JVM, see :func:`pymoa.utils.utils.build_java_options`.
+
+        Options only apply if this estimator is the one launching the shared
+        JVM, so set them before the first call that needs Java.
+
+        :param max_heap: Maximum heap size, e.g. ``"8g"``.
+        :param initial_heap: Initial heap size, e.g. ``"2g"``.
+        :param gc: Garbage collector, e.g. ``"g1"`` or ``"zgc"``.
+        :param jit_options: JIT flags.
+        :param options: Any other JVM options.
+        """
+        self._java_options = build_java_options(
+            max_heap=max_heap,
+            initial_heap=initial_heap,
+            gc=gc,
+            jit_options=jit_options,
+            options=options,
+        )
+        return self
+
+    @property
+    def wire_dtype(self) -> str:
+        return self._wire_dtype
+
+    def set_wire_dtype(
+        self,
+        dtype: str = "float64",
+        scale: Iterable[float] = None,
+        offset: Iterable[float] = None,
+        sample: Iterable[Iterable[float]] = None,
+    ):
+        """
+        Choose how dense blocks are encoded on their way to the JVM.
+
+        ``"float32"`` halves the bytes moved per value and is widened back to
+        doubles exactly on the JVM. ``"int16"`` and ``"int8"`` send quantized
+        codes, decoded per feature as ``code * scale + offset``, so values are
+        off by at most ``scale / 2`` and values outside the quantized range are
+        clipped. Labels are always sent exactly. On the JPype bridge blocks
+        are copied from memory rather than sent, so the wire dtype is ignored.
+
+        :param dtype: ``"float64"``, ``"float32"``, ``"int16"`` or ``"int8"``.
+        :param scale: Quantization step of every feature, or of all of them.
+        :param offset: Value of code 0 of every feature, or of all of them.
+        :param sample: Vectors to fit ``scale`` and ``offset`` on, so their
+            range spans the codes, when these are not given.
+        """
+        if dtype not in _WIRE_DTYPES:
+            raise ValueError(f"dtype must be one of {sorted(_WIRE_DTYPES)}, got {dtype!r}.")
+
+        code_range = _WIRE_DTYPES[dtype][1]
+        if code_range is None:
+            scale = offset = None
+        else:
+            if scale is None or offset is None:
+                if sample is None:
+                    raise ValueError(f"{dtype} needs either scale and offset or a sample to fit them on.")
+                sample = self._check_array(sample)
+                if sparse.issparse(sample):
+                    sample = sample.toarray()
+                low = sample.min(axis=0)
+                scale = (sample.max(axis=0) - low) / (code_range[1] - code_range[0])
+                scale[scale == 0] = 1.0
+                offset = low - code_range[0] * scale
+            scale = np.broadcast_to(np.asarray(scale, dtype=np.float64), (self._dimensions,)).copy()
+            offset = np.broadcast_to(np.asarray(offset, dtype=np.float64), (self._dimensions,)).copy()
+            if np.any(scale <= 0):
+                raise ValueError("scale must be positive.")
+
+        self._release_wire_factors()
+        self._wire_dtype = dtype
+        self._wire_scale = scale
+        self._wire_offset = offset
+        return self
+
+    def set_refresh_policy(self, every_n: int = 1, every_seconds: float = None):
+        """
+        Set when the clustering used for prediction is recomputed.
+
+        Learned points make the clustering stale, and a prediction recomputes
+        it first when at least ``every_n`` points were learned
+        since the last refresh, or when ``every_seconds`` have passed and new
+        points arrived. Either bound guarantees the maximum staleness of the
+        predictions. With both set to ``None`` the clustering is only
+        recomputed by :meth:`refresh`. The default, ``every_n=1``, refreshes
+        after every learned point.
+
+        :param every_n: Maximum number of points learned between refreshes.
+        :param every_seconds: Maximum age in seconds of the clustering.
+        """
+        if every_n is not None and every_n < 1:
+            raise ValueError(f"every_n must be at least 1, got {every_n}.")
+        if every_seconds is not None and every_seconds < 0:
+            raise ValueError(f"every_seconds must not be negative, got {every_seconds}.")
+        self._refresh_every_n = every_n
+        self._refresh_interval = every_seconds
+        return self
+
+    def refresh(self):
+        """Recompute the clustering used for prediction now."""
+        self._ensure_java()
+        self._reset_clusterering()
+        self._get_clustering()
+        return self
+
+    @property
+    def background_refresh(self) -> bool:
+        """Whether the clustering is refreshed by a background thread."""
+        return self._refresh_thread is not None
+
+    def enable_background_refresh(self, enabled: bool = True):
+        """
+        Refresh the clustering in a background thread.
+
+        When the refresh policy finds the clustering stale, a background thread
+        copies the clusterer, computes the next clustering (and snapshot, with
+        local prediction) from the copy, and swaps it in atomically. Meanwhile
+        learning continues and predictions use the previous clustering. Only
+        the very first clustering is computed in the foreground.
+
+        :param enabled: Start or stop the background thread.
+        """
+        if enabled and self._refresh_thread is None:
+            self._refresh_wakeup = threading.Event()
+            self._refresh_stop = threading.Event()
+            self._refresh_thread = threading.Thread(
+                target=_run_background_refresh,
+                args=(weakref.ref(self), self._refresh_wakeup, self._refresh_stop),
+                name=f"{type(self).__name__}-refresh",
+                daemon=True,
+            )
+            self._refresh_thread.start()
+        elif not enabled and self._refresh_thread is not None:
+            self._refresh_stop.set()
+            self._refresh_wakeup.set()
+            if self._refresh_thread is not threading.current_thread():
+                self._refresh_thread.join()
+            self._refresh_thread = None
+            self._refresh_wakeup = None
+            self._refresh_stop = None
+        return self
+
+    @property
+    def instrumentation(self) -> Instrumentation:
+        """Get the instrumentation, ``None`` when disabled."""
+        return self._instrumentation
+
+    def enable_instrumentation(self, callback: Callable[[str, float, int], None] = None):
+        """
+        Record counters and latency histograms of the hot paths.
+
+        Recorded events are ``instance`` (building instances on the JVM),
+        ``transfer`` (moving a block across the bridge), ``train``
+        (``trainOnInstanceImpl``), ``refresh`` (computing the clustering) and
+        ``predict``. When disabled, the hot paths only pay a ``None`` check.
+
+        :param callback: Optional hook called as ``callback(event, seconds, count)``.
+        """
+        self._instrumentation = Instrumentation(callback=callback)
+        return self
+
+    def disable_instrumentation(self):
+        """Stop recording and drop the recorded statistics."""
+        self._instrumentation = None
+        return self
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get the recorded statistics, see :meth:`Instrumentation.stats`."""
+        if self._instrumentation is None:
+            return {}
+        return self._instrumentation.stats()
+
     def _generate_header(self):
         """
         Generate header.
@@ -123,38 +453,483 @@ class BaseClustering(BaseEstimator, ClusterMixin):
         """Initialize clusterer."""
         pass
 
-    def _create_instance(self, vector: Iterable[float], y: int = None) -> Any:
-        """Create instance."""
-        instance = self._gateway.jvm.DenseInstance(float(self._dimensions))
-        
-        st = time.time()
+    def _setup_java(self, imports: List[str], jars: List[str] = _JARS):
+        """
+        Attach to the shared java gateway and create the MOA objects.
+
+        The gateway reference and the Java objects are released by
+        :meth:`close`, or when the estimator is garbage collected.
+
+        :param imports: List of fully qualified class paths to import.
+        :param jars: Names of the jars the clusterer needs.
+        """
+        self._gateway = acquire_java_gateway(
+            imports=imports, jars=jars, java_options=self._java_options
+        )
+        self._header = self._generate_header()
+        if self._clusterer_state is None:
+            self._clusterer = self._initialize_clusterer()
+        else:
+            self._clusterer = self._deserialize_clusterer(self._clusterer_state)
+            self._clusterer_state = None
+        track_java_objects(self._gateway, [self._header, self._clusterer])
+        self._finalizer = weakref.finalize(
+            self,
+            release_java_gateway,
+            self._gateway,
+            [self._header, self._clusterer],
+        )
+        return self
+
+    def warm_up(self, num_points: int = 10000, random_seed: int = 0):
+        """
+        Run synthetic points through a throwaway clusterer.
+
+        Training, clustering and inclusion tests are compiled by the JIT
+        before the first real points arrive. The estimator's own clusterer is
+        left untouched.
+
+        :param num_points: Number of synthetic points.
+        :param random_seed: Seed of the synthetic points.
+        """
+        self._ensure_java()
+        rng = np.random.RandomState(random_seed)
+        X = rng.standard_normal((num_points, self._dimensions))
+
+        clusterer = self._initialize_clusterer()
+        instances = self._create_instances(X)
+        try:
+            for instance in instances:
+                clusterer.trainOnInstanceImpl(instance)
+            clustering = self._compute_clustering(clusterer)
+            if clustering is not None:
+                for instance in instances[:1000]:
+                    for c in range(clustering.size()):
+                        clustering.get(c).getInclusionProbability(instance)
+        finally:
+            self._release_instances(instances)
+            self._gateway.detach(clusterer)
+        return self
+
+    def _serialize_clusterer(self) -> bytes:
+        """Serialize the MOA clusterer with Java serialization."""
+        jvm = self._gateway.jvm
+        output = jvm.ByteArrayOutputStream()
+        stream = jvm.ObjectOutputStream(output)
+        with self._clusterer_lock:
+            stream.writeObject(self._clusterer)
+        stream.close()
+        return bytes(output.toByteArray())
+
+    def _deserialize_clusterer(self, state: bytes) -> Any:
+        """Rebuild a MOA clusterer serialized by :meth:`_serialize_clusterer`."""
+        jvm = self._gateway.jvm
+        stream = jvm.ObjectInputStream(jvm.ByteArrayInputStream(state))
+        clusterer = stream.readObject()
+        stream.close()
+        return clusterer
+
+    def save(self, path: str) -> None:
+        """
+        Save a checkpoint of the model.
 
-        for index, number in enumerate(vector):
-            instance.setValue(index, number)
-        et = time.time()
-        print("setValue time: ", et - st)
-        instance.setDataset(self._header)
+        The file holds the Java-serialized MOA clusterer, the estimator
+        hyperparameters, the timestamp and the settings made with
+        :meth:`set_refresh_policy`, :meth:`enable_background_refresh`,
+        :meth:`enable_local_predict`, :meth:`set_wire_dtype` and
+        :meth:`set_java_options`, compressed with NumPy's ``.npz`` format.
+        Instrumentation callbacks are not saved. Ingestion is only blocked while the clusterer is serialized on
+        the JVM; compression and writing happen afterwards, and the file is
+        replaced atomically, so it is safe to checkpoint periodically from
+        another thread.
 
+        :param path: Path of the checkpoint file.
+        """
+        self._ensure_java()
+        state = self._serialize_clusterer()
+        metadata = {
+            "class": f"{type(self).__module__}.{type(self).__qualname__}",
+            "params": self.get_params(),
+            "timestamp": self._m_timestamp,
+            "settings": {
+                "refresh_every_n": self._refresh_every_n,
+                "refresh_interval": self._refresh_interval,
+                "background_refresh": self.background_refresh,
+                "local_predict": self._local_predict,
+                "wire_dtype": self._wire_dtype,
+                "wire_scale": None if self._wire_scale is None else self._wire_scale.tolist(),
+                "wire_offset": None if self._wire_offset is None else self._wire_offset.tolist(),
+                "java_options": self._java_options,
+            },
+        }
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            np.savez_compressed(
+                file,
+                clusterer=np.frombuffer(state, dtype=np.uint8),
+                metadata=np.array(json.dumps(metadata)),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BaseClustering":
+        """
+        Load a model saved with :meth:`save`.
+
+        The clusterer is restored on the JVM when the model is first used.
+
+        :param path: Path of the checkpoint file.
+        """
+        with np.load(path, allow_pickle=False) as checkpoint:
+            metadata = json.loads(str(checkpoint["metadata"]))
+            state = checkpoint["clusterer"].tobytes()
+
+        module_name, _, class_name = metadata["class"].rpartition(".")
+        klass = getattr(importlib.import_module(module_name), class_name)
+        if not issubclass(klass, cls):
+            raise TypeError(f"{metadata['class']} is not a {cls.__name__}.")
+
+        estimator = klass(**metadata["params"])
+        estimator._clusterer_state = state
+        estimator._m_timestamp = metadata["timestamp"]
+
+        settings = metadata.get("settings", {})
+        estimator.set_refresh_policy(
+            every_n=settings.get("refresh_every_n", 1),
+            every_seconds=settings.get("refresh_interval"),
+        )
+        estimator.enable_local_predict(settings.get("local_predict", False))
+        if settings.get("wire_dtype", "float64") != "float64":
+            estimator.set_wire_dtype(
+                settings["wire_dtype"], scale=settings["wire_scale"], offset=settings["wire_offset"]
+            )
+        estimator._java_options = settings.get("java_options")
+        if settings.get("background_refresh"):
+            estimator.enable_background_refresh()
+        return estimator
+
+    def _ensure_java(self):
+        """Start the java side on first use instead of at construction."""
+        if self._clusterer is None:
+            self._setup_java(imports=self._java_imports, jars=self._java_jars)
+        return self
+
+    def close(self) -> None:
+        """
+        Release the Java objects and the shared gateway reference.
+
+        Using the estimator afterwards starts a new, untrained clusterer.
+        """
+        self.enable_background_refresh(False)
+        self._release_wire_factors()
+        if self._finalizer is not None:
+            self._finalizer()
+        self._gateway = None
+        self._header = None
+        self._clusterer = None
+        self._instances = []
+        self._found_clustering = None
+        self._snapshot = None
+        self._last_instance = None
+
+    def _check_array(self, X: Iterable[Iterable[float]]) -> np.ndarray:
+        """Convert input vectors to a 2-D float array, or a CSR matrix if sparse."""
+        if sparse.issparse(X):
+            X = sparse.csr_matrix(X, dtype=np.float64)
+        else:
+            X = np.asarray(X, dtype=np.float64)
+            if X.shape[:1] == (0,):
+                # An empty batch, e.g. [], has no vectors to check.
+                return np.empty((0, self._dimensions))
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.ndim != 2 or X.shape[1] != self._dimensions:
+            raise ValueError(
+                f"Expected vectors of {self._dimensions} dimensions, got shape {X.shape}."
+            )
+        return X
+
+    def _pack_block(self, X: np.ndarray, y: Iterable[int] = None) -> bytes:
+        """
+        Pack a block of vectors into a little-endian buffer of the wire dtype.
+
+        Labels, when given, are appended as the last (class) attribute.
+        """
+        dtype, code_range = _WIRE_DTYPES[self._wire_dtype]
+        if code_range is not None:
+            X = np.clip(np.rint((X - self._wire_offset) / self._wire_scale), *code_range)
         if y is not None:
-            instance.setClassValue(float(y))
+            y = np.asarray(y, dtype=np.float64)
+            if code_range is not None and y.size and (y.min() < code_range[0] or y.max() > code_range[1]):
+                raise ValueError(f"Labels do not fit in {self._wire_dtype} codes.")
+            X = np.column_stack([X, y])
+        return np.ascontiguousarray(X, dtype=dtype).tobytes()
 
-        return instance
+    def _unpack_block(self, data: bytes, num_rows: int, width: int) -> Any:
+        """
+        Unpack a buffer made by :meth:`_pack_block` into a ``double[]`` on the JVM.
+
+        Narrower values are widened by reading them through a ``Raster``, the
+        JDK's only bulk conversion to doubles, and quantized codes are then
+        rescaled per feature with Jama.
+        """
+        gateway = self._gateway
+        num_values = num_rows * width
+        buffer = gateway.jvm.ByteBuffer.wrap(data).order(gateway.jvm.ByteOrder.LITTLE_ENDIAN)
+        values = gateway.new_array(gateway.jvm.double, num_values)
+        if self._wire_dtype == "float64":
+            buffer.asDoubleBuffer().get(values)
+            return values
+
+        DataBuffer = gateway.jvm.DataBuffer
+        if self._wire_dtype == "float32":
+            codes = gateway.new_array(gateway.jvm.float, num_values)
+            buffer.asFloatBuffer().get(codes)
+            data_buffer = gateway.jvm.DataBufferFloat(codes, num_values)
+            data_type = DataBuffer.TYPE_FLOAT
+        elif self._wire_dtype == "int16":
+            codes = gateway.new_array(gateway.jvm.short, num_values)
+            buffer.asShortBuffer().get(codes)
+            data_buffer = gateway.jvm.DataBufferShort(codes, num_values)
+            data_type = DataBuffer.TYPE_SHORT
+        else:
+            codes = gateway.new_array(gateway.jvm.byte, num_values)
+            buffer.get(codes)
+            data_buffer = gateway.jvm.DataBufferByte(codes, num_values)
+            data_type = DataBuffer.TYPE_BYTE
+
+        sample_model = gateway.jvm.BandedSampleModel(data_type, num_values, 1, 1)
+        raster = gateway.jvm.Raster.createRaster(sample_model, data_buffer, None)
+        raster.getPixels(0, 0, num_values, 1, values)
+        if _WIRE_DTYPES[self._wire_dtype][1] is None:
+            return values
+
+        # One column per point, so column-packed arrays keep the row-major layout.
+        matrix = gateway.jvm.Matrix(values, width)
+        scale, offset = self._get_wire_factors(width)
+        for start in range(0, num_rows, _DEQUANTIZE_BLOCK):
+            end = min(start + _DEQUANTIZE_BLOCK, num_rows)
+            block = matrix.getMatrix(0, width - 1, start, end - 1)
+            if end - start == _DEQUANTIZE_BLOCK:
+                block.arrayTimesEquals(scale).plusEquals(offset)
+            else:
+                block.arrayTimesEquals(scale.getMatrix(0, width - 1, 0, end - start - 1))
+                block.plusEquals(offset.getMatrix(0, width - 1, 0, end - start - 1))
+            matrix.setMatrix(0, width - 1, start, end - 1, block)
+        return matrix.getColumnPackedCopy()
+
+    def _get_wire_factors(self, width: int) -> Tuple[Any, Any]:
+        """Get the Jama matrices of scales and offsets tiled over a block."""
+        factors = self._wire_factors.get(width)
+        if factors is None:
+            scale = self._wire_scale
+            offset = self._wire_offset
+            if width > self._dimensions:
+                # Labels are sent as their own codes.
+                scale = np.append(scale, 1.0)
+                offset = np.append(offset, 0.0)
+
+            gateway = self._gateway
+            factors = []
+            for column in (scale, offset):
+                tiled = np.tile(column, _DEQUANTIZE_BLOCK).astype("<f8").tobytes()
+                values = gateway.new_array(gateway.jvm.double, width * _DEQUANTIZE_BLOCK)
+                gateway.jvm.ByteBuffer.wrap(tiled).order(
+                    gateway.jvm.ByteOrder.LITTLE_ENDIAN
+                ).asDoubleBuffer().get(values)
+                factors.append(gateway.jvm.Matrix(values, width))
+            factors = tuple(factors)
+            self._wire_factors[width] = factors
+        return factors
+
+    def _release_wire_factors(self) -> None:
+        """Release the cached scale and offset matrices on the JVM."""
+        if self._gateway is not None:
+            for factors in self._wire_factors.values():
+                for matrix in factors:
+                    self._gateway.detach(matrix)
+        self._wire_factors = {}
+
+    def _create_instances(
+        self, X: Iterable[Iterable[float]], y: Iterable[int] = None
+    ) -> List[Any]:
+        """
+        Create instances for vectors, see :meth:`_iter_instance_blocks`.
+
+        Every instance is kept alive, so callers that can should iterate over
+        the blocks and release them instead.
+        """
+        instances = []
+        for block in self._iter_instance_blocks(X, y=y):
+            instances.extend(block)
+        return instances
+
+    def _iter_instance_blocks(
+        self, X: Iterable[Iterable[float]], y: Iterable[int] = None
+    ) -> Iterator[List[Any]]:
+        """
+        Create instances for consecutive blocks of vectors.
+
+        Each block crosses the bridge as one byte buffer of at most
+        ``_TRANSFER_BYTES`` and is unpacked into a single ``double[]`` on the
+        JVM side, so the number of round trips per instance does not depend
+        on the data dimensionality, and buffers stay bounded however large
+        the input. Sparse input is densified a block at a time unless the
+        clusterer handles ``SparseInstance``s, see ``_sparse_instances``.
+        """
+        X = self._check_array(X)
+        if y is not None:
+            y = np.asarray(y)
+        num_rows = X.shape[0]
+        width = self._dimensions if y is None else self._dimensions + 1
+        if sparse.issparse(X) and self._sparse_instances:
+            # A double and an int per stored value.
+            row_bytes = 12 * max(X.nnz / max(num_rows, 1), 1.0)
+        else:
+            row_bytes = 8 * width
+        block_rows = max(int(_TRANSFER_BYTES // row_bytes), 1)
+
+        for start in range(0, num_rows, block_rows):
+            X_block = X[start:start + block_rows]
+            y_block = None if y is None else y[start:start + block_rows]
+            if not sparse.issparse(X_block):
+                yield self._create_dense_instances(X_block, y=y_block)
+            elif self._sparse_instances:
+                yield self._create_sparse_instances(X_block, y=y_block)
+            else:
+                yield self._create_dense_instances(X_block.toarray(), y=y_block)
+
+    def _create_dense_instances(self, X: np.ndarray, y: Iterable[int] = None) -> List[Any]:
+        """Create ``DenseInstance``s for a 2-D array, see :meth:`_iter_instance_blocks`."""
+        num_rows = X.shape[0]
+        gateway = self._gateway
+        width = self._dimensions if y is None else self._dimensions + 1
+        probe = self._instrumentation
+        if probe is not None:
+            start_time = time.perf_counter()
+
+        if isinstance(gateway, JPypeGateway):
+            # In-process, the rows are copied once from the array into a
+            # double[][], with no encoding on the way.
+            if y is not None:
+                X = np.column_stack([X, np.asarray(y, dtype=np.float64)])
+            rows = gateway.to_java_array(np.ascontiguousarray(X, dtype=np.float64))
+        else:
+            values = self._unpack_block(self._pack_block(X, y=y), num_rows, width)
+            Arrays = gateway.jvm.Arrays
+            rows = (
+                Arrays.copyOfRange(values, start, start + width)
+                for start in range(0, num_rows * width, width)
+            )
+
+        if probe is not None:
+            probe.record("transfer", time.perf_counter() - start_time, num_rows)
+            start_time = time.perf_counter()
+
+        DenseInstance = gateway.jvm.DenseInstance
+        instances = []
+        for row in rows:
+            instance = DenseInstance(1.0, row)
+            instance.setDataset(self._header)
+            instances.append(instance)
+
+        if probe is not None:
+            probe.record("instance", time.perf_counter() - start_time, num_rows)
+        return instances
+
+    def _create_sparse_instances(self, X: sparse.csr_matrix, y: Iterable[int] = None) -> List[Any]:
+        """
+        Create ``SparseInstance``s for a CSR matrix.
+
+        Only for clusterers reading instances by attribute index, see
+        ``_sparse_instances``. Only the nonzero values and their indices
+        cross the bridge, as two byte buffers, or on JPype as two arrays
+        copied straight from NumPy. Labels, when given, are stored at the
+        class index.
+        """
+        if y is not None:
+            X = sparse.hstack(
+                [X, sparse.csr_matrix(np.asarray(y, dtype=np.float64).reshape(-1, 1))],
+                format="csr",
+            )
+        else:
+            X = X.copy()
+        X.sum_duplicates()
+        X.sort_indices()
+
+        gateway = self._gateway
+        num_rows = X.shape[0]
+        num_attributes = X.shape[1]
+        probe = self._instrumentation
+        if probe is not None:
+            start_time = time.perf_counter()
+
+        if isinstance(gateway, JPypeGateway):
+            values = gateway.to_java_array(np.ascontiguousarray(X.data, dtype=np.float64))
+            indices = gateway.to_java_array(np.ascontiguousarray(X.indices, dtype=np.int32))
+        else:
+            little_endian = gateway.jvm.ByteOrder.LITTLE_ENDIAN
+            values = gateway.new_array(gateway.jvm.double, X.nnz)
+            buffer = gateway.jvm.ByteBuffer.wrap(np.ascontiguousarray(X.data, dtype="<f8").tobytes())
+            buffer.order(little_endian).asDoubleBuffer().get(values)
+            indices = gateway.new_array(gateway.jvm.int, X.nnz)
+            buffer = gateway.jvm.ByteBuffer.wrap(np.ascontiguousarray(X.indices, dtype="<i4").tobytes())
+            buffer.order(little_endian).asIntBuffer().get(indices)
+
+        if probe is not None:
+            probe.record("transfer", time.perf_counter() - start_time, num_rows)
+            start_time = time.perf_counter()
+
+        Arrays = gateway.jvm.Arrays
+        SparseInstance = gateway.jvm.SparseInstance
+        indptr = X.indptr.tolist()
+        instances = []
+        for start, end in zip(indptr[:-1], indptr[1:]):
+            instance = SparseInstance(
+                1.0,
+                Arrays.copyOfRange(values, start, end),
+                Arrays.copyOfRange(indices, start, end),
+                num_attributes,
+            )
+            instance.setDataset(self._header)
+            instances.append(instance)
+
+        if probe is not None:
+            probe.record("instance", time.perf_counter() - start_time, num_rows)
+        return instances
+
+    def _create_instance(self, vector: Iterable[float], y: int = None) -> Any:
+        """Create instance."""
+        if not sparse.issparse(vector):
+            vector = [vector]
+        return self._create_instances(vector, y=None if y is None else [y])[0]
 
     def _reset_clusterering(self):
         self._found_clustering = None
+        self._snapshot = None
         return self
 
     def _reset_instances(self):
+        self._release_instances(self._instances)
         self._instances = []
         return self
 
-    def _get_clustering(self):
-        found_clustering = self._clusterer.getClusteringResult()
+    def _release_instances(self, instances: Iterable[Any]) -> None:
+        """Detach instances so the JVM can collect them."""
+        for instance in instances:
+            if instance is self._last_instance:
+                self._last_instance = None
+            self._gateway.detach(instance)
+
+    def _compute_clustering(self, clusterer: Any):
+        """Compute the clustering to predict with from a MOA clusterer."""
+        found_clustering = clusterer.getClusteringResult()
         # ground_true_clustering = self._gateway.jvm.Clustering(self._data_points)
-        if self._clusterer.implementsMicroClusterer():
-            micro_clustering = self._clusterer.getMicroClusteringResult()
+        if clusterer.implementsMicroClusterer():
+            micro_clustering = clusterer.getMicroClusteringResult()
 
-            if self._clusterer.evaluateMicroClusteringOption.isSet():
+            if clusterer.evaluateMicroClusteringOption.isSet():
                 found_clustering = micro_clustering
             else:
                 if found_clustering is None and micro_clustering is not None:
@@ -163,9 +938,92 @@ class BaseClustering(BaseEstimator, ClusterMixin):
                     # found_clustering = kmeans.gaussianMeans(
                     #     ground_true_clustering, micro_clustering
                     # )
-        self._found_clustering = found_clustering
         return found_clustering
 
+    def _get_clustering(self):
+        probe = self._instrumentation
+        if probe is not None:
+            start_time = time.perf_counter()
+
+        with self._clusterer_lock:
+            found_clustering = self._compute_clustering(self._clusterer)
+            self._found_clustering = found_clustering
+            self._points_since_refresh = 0
+            self._last_refresh = time.monotonic()
+
+        if probe is not None:
+            probe.record("refresh", time.perf_counter() - start_time)
+        return found_clustering
+
+    def _refresh_in_background(self) -> None:
+        """Compute the next clustering from a copy of the clusterer and swap it in."""
+        probe = self._instrumentation
+        if probe is not None:
+            start_time = time.perf_counter()
+
+        with self._clusterer_lock:
+            if self._clusterer is None:
+                return
+            gateway = self._gateway
+            clusterer = self._clusterer.copy()
+            points = self._points_since_refresh
+
+        try:
+            found_clustering = self._compute_clustering(clusterer)
+            snapshot = None
+            if self._local_predict:
+                snapshot = ClusteringSnapshot.from_clustering(
+                    gateway, found_clustering, self._dimensions
+                )
+        finally:
+            gateway.detach(clusterer)
+
+        with self._clusterer_lock:
+            self._found_clustering = found_clustering
+            self._snapshot = snapshot
+            self._points_since_refresh -= points
+            self._last_refresh = time.monotonic()
+
+        if probe is not None:
+            probe.record("refresh", time.perf_counter() - start_time)
+
+    def _is_stale(self) -> bool:
+        """Whether the refresh policy requires recomputing the clustering."""
+        if self._found_clustering is None:
+            return True
+        if self._points_since_refresh == 0:
+            return False
+        if self._refresh_every_n is not None and self._points_since_refresh >= self._refresh_every_n:
+            return True
+        if self._refresh_interval is not None:
+            return time.monotonic() - self._last_refresh >= self._refresh_interval
+        return False
+
+    def _request_background_refresh(self) -> None:
+        """Wake the background thread when the clustering became stale."""
+        if self._refresh_thread is not None and self._found_clustering is not None and self._is_stale():
+            self._refresh_wakeup.set()
+
+    def _current_clustering(self):
+        """Get the clustering to predict with, refreshing it when stale."""
+        if self._refresh_thread is not None and self._found_clustering is not None:
+            self._request_background_refresh()
+            return self._found_clustering
+
+        if self._is_stale():
+            self._reset_clusterering()
+            return self._get_clustering()
+        return self._found_clustering
+
+    def _get_snapshot(self) -> ClusteringSnapshot:
+        """Get the local snapshot of the current clustering."""
+        found_clustering = self._current_clustering()
+        if self._snapshot is None:
+            self._snapshot = ClusteringSnapshot.from_clustering(
+                self._gateway, found_clustering, self._dimensions
+            )
+        return self._snapshot
+
     def transform(self) -> None:
         """Transform."""
         raise NotImplementedError
@@ -174,52 +1032,90 @@ class BaseClustering(BaseEstimator, ClusterMixin):
         """
         Partial fit model.
 
+        Classes are not learned, they would leak into the clusters.
+
         :param X: An iterable of vectors.
         """
-        st = time.time()
-        instance = self._create_instance(x, y=y)
-        et = time.time()
-        print("create instance time: ", et - st)
+        self._ensure_java()
+        instance = self._create_instance(x)
         # point = self._gateway.jvm.DataPoint(instance, self._m_timestamp)
         # if y is not None:
         #     instance.deleteAttributeAt(point.classIndex())
-        st = time.time()
-        self._clusterer.trainOnInstanceImpl(instance)
-        et = time.time()
-        print("trainOnInstanceImpl time: ", et - st)
-        self._m_timestamp += 1
+        probe = self._instrumentation
+        if probe is not None:
+            start_time = time.perf_counter()
 
-        if self._found_clustering is not None:
-            self._reset_clusterering()
+        with self._clusterer_lock:
+            self._clusterer.trainOnInstanceImpl(instance)
+            self._points_since_refresh += 1
+
+        if probe is not None:
+            probe.record("train", time.perf_counter() - start_time)
+        self._m_timestamp += 1
         self._last_instance = instance
+        self._request_background_refresh()
         return self
 
     def learn_batch(self, X: Iterable[Iterable[float]], lables: Iterable[int] = None):
         """
         Partial fit model.
 
-        :param X: An iterable of vectors.
-        """
+        Vectors cross to the JVM a block at a time, see
+        :meth:`_iter_instance_blocks`, and every block is released once learned.
 
-        if lables is None:
-            for vector in X:
-                self.learn_one(vector)
-                self._instances.append(self.last_instance)
-        else:
-            for vector, y in zip(X, lables):
-                self.learn_one(vector, y=y)
-                self._instances.append(self.last_instance)
+        :param X: A 2-D array, a ``scipy.sparse`` matrix or an iterable of vectors.
+        :param lables: Ignored, classes are not learned, see :meth:`learn_one`.
+        """
+        self._ensure_java()
+        for instances in self._iter_instance_blocks(X):
+            try:
+                self._learn_instances(instances)
+            finally:
+                self._release_instances(instances)
         return self
 
+    def _learn_instances(self, instances: List[Any]) -> None:
+        """Train the clusterer on instances created on the JVM."""
+        probe = self._instrumentation
+
+        for instance in instances:
+            if probe is not None:
+                start_time = time.perf_counter()
+
+            with self._clusterer_lock:
+                self._clusterer.trainOnInstanceImpl(instance)
+                self._points_since_refresh += 1
+
+            if probe is not None:
+                probe.record("train", time.perf_counter() - start_time)
+        self._m_timestamp += len(instances)
+
+        if instances:
+            self._last_instance = instances[-1]
+            self._request_background_refresh()
+
     def predict_one(self, x: Iterable[float], y: int = None) -> int:
+        self._ensure_java()
+        probe = self._instrumentation
+        if probe is None:
+            return self._predict_one(x, y=y)
+
+        start_time = time.perf_counter()
+        label = self._predict_one(x, y=y)
+        probe.record("predict", time.perf_counter() - start_time)
+        return label
+
+    def _predict_one(self, x: Iterable[float], y: int = None) -> int:
+        if self._local_predict and not is_java_object(x):
+            return int(self._get_snapshot().predict(self._check_array(x))[0])
+
         covered = False
         label = 0
         min_distance = np.inf
-        if self._found_clustering is None:
-            found_clustering = self._get_clustering()
-        else:
-            found_clustering = self._found_clustering
-        if isinstance(x, JavaObject):
+        found_clustering = self._current_clustering()
+        if found_clustering is None:
+            return -1
+        if is_java_object(x):
             instance = x
         else:
             instance = self._create_instance(x, y=y)
@@ -239,26 +1135,83 @@ class BaseClustering(BaseEstimator, ClusterMixin):
     def predict_batch(
         self, X: Iterable[Iterable[float]], lables: Iterable[int] = None
     ) -> List[int]:
-        if lables is None:
-            labels = [self.predict_one(vector) for vector in X]
-        else:
-            labels = [self.predict_one(vector, y=y) for vector, y in zip(X, lables)]
+        self._ensure_java()
+        is_instances = isinstance(X, (list, tuple)) and len(X) > 0 and is_java_object(X[0])
+        if self._local_predict and not is_instances:
+            probe = self._instrumentation
+            if probe is not None:
+                start_time = time.perf_counter()
+
+            labels = self._get_snapshot().predict(self._check_array(X)).tolist()
+
+            if probe is not None:
+                probe.record("predict", time.perf_counter() - start_time, len(labels))
+            return labels
+
+        if is_instances:
+            return [self.predict_one(instance) for instance in X]
+
+        labels = []
+        for instances in self._iter_instance_blocks(X, y=lables):
+            try:
+                labels.extend(self.predict_one(instance) for instance in instances)
+            finally:
+                self._release_instances(instances)
         return labels
 
     def fit_predict(
         self, X: Iterable[Iterable[float]], lables: Iterable[int] = None
     ) -> List[int]:
         """
-        Partial fit model.
+        Partial fit model and predict the cluster of every vector.
 
-        :param X: An iterable of vectors.
+        Every vector is predicted with the clustering learned from all of
+        them. Vectors are learned a block at a time, then predicted a block
+        at a time, so JVM memory stays bounded by one block.
+
+        :param X: A 2-D array or an iterable of vectors.
+        :param lables: Ignored, classes are not learned, see :meth:`learn_one`.
+        """
+        X = self._check_array(X)
+        self.learn_batch(X)
+        return self.predict_batch(X)
+
+    def fit_predict_iter(
+        self,
+        X: Iterable[Iterable[float]],
+        lables: Iterable[int] = None,
+        chunk_size: int = 10000,
+    ) -> Iterator[np.ndarray]:
         """
-        st = time.time()
-        clf = self.learn_batch(X, lables=lables)
-        et = time.time()
-        print("fit time: ", et - st)
-        
-        return clf.predict_batch(self._instances, lables=lables)
+        Partial fit model and predict chunk by chunk.
+
+        Every chunk is learned, predicted with the clustering at that point of
+        the stream, and its instances are released on the JVM before the next
+        chunk is read. Memory stays bounded by ``chunk_size`` on both sides of
+        the bridge, so ``X`` can be an arbitrarily long iterable of vectors.
+
+        :param X: A 2-D array or an iterable of vectors.
+        :param lables: Optional labels, consumed alongside ``X`` and not learned.
+        :param chunk_size: Number of vectors per chunk.
+        :return: A generator of label arrays, one per chunk.
+        """
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size must be at least 1, got {chunk_size}.")
+
+        self._ensure_java()
+        for X_chunk, y_chunk in _iter_chunks(X, lables, chunk_size):
+            X_chunk = self._check_array(X_chunk)
+            instances = self._create_instances(X_chunk)
+            try:
+                self._learn_instances(instances)
+                if self._local_predict:
+                    labels = self.predict_batch(X_chunk)
+                else:
+                    labels = self.predict_batch(instances)
+            finally:
+                self._release_instances(instances)
+
+            yield np.asarray(labels, dtype=np.int64)
 
     def fit_predict_one(self, x: Iterable[float], y: int = None) -> int:
         """
@@ -266,6 +1219,85 @@ class BaseClustering(BaseEstimator, ClusterMixin):
 
         :param X: An iterable of vectors.
         """
-        clf = self.learn_one(x, y=y, return_instance=True)
+        self.learn_one(x, y=y)
+
+        return self.predict_one(self.last_instance, y=y)
+
+    def evaluate_cmm(
+        self,
+        X: Iterable[Iterable[float]],
+        lables: Iterable[int],
+        timestamps: Iterable[int] = None,
+        sample_size: int = None,
+        random_seed: int = None,
+    ) -> Dict[str, float]:
+        """
+        Evaluate the current clustering with MOA's CMM on labelled points.
 
-        return clf.predict_one(clf.last_instance, y=y)
+        The points cross to the JVM in one bulk transfer, see
+        :meth:`_create_instances`, and the ground truth clustering is built by
+        MOA from their classes. Everything is released on the JVM afterwards.
+
+        :param X: A 2-D array or an iterable of vectors.
+        :param lables: Class of every vector.
+        :param timestamps: Arrival time of every vector, defaults to the last
+            ``len(X)`` timestamps seen by the model.
+        :param sample_size: Optional number of points drawn uniformly without
+            replacement to evaluate on, which bounds the cost of CMM.
+        :param random_seed: Seed of the sample.
+        :return: The value of every CMM measure, keyed by name.
+        """
+        self._ensure_java()
+        found_clustering = self._current_clustering()
+        if found_clustering is None:
+            return {}
+
+        X = self._check_array(X)
+        lables = np.asarray(lables)
+        if timestamps is None:
+            timestamps = np.arange(self._m_timestamp - X.shape[0], self._m_timestamp)
+        timestamps = np.asarray(timestamps)
+        if sample_size is not None and sample_size < X.shape[0]:
+            rng = np.random.RandomState(random_seed)
+            sample = np.sort(rng.choice(X.shape[0], sample_size, replace=False))
+            X, lables, timestamps = X[sample], lables[sample], timestamps[sample]
+
+        instances = self._create_instances(X, y=lables)
+        try:
+            points = to_data_points(self._gateway, instances, timestamps)
+        finally:
+            self._release_instances(instances)
+
+        try:
+            return cmm_score(self._gateway, found_clustering, None, points)
+        finally:
+            self._gateway.detach(points)
+
+    def export_clustering(self) -> np.ndarray:
+        """
+        Export the current clustering, the one predictions use.
+
+        :return: A structured array with one record per cluster, see
+            :func:`pymoa.models.clustering.snapshot.export_clusters`.
+        """
+        self._ensure_java()
+        with self._clusterer_lock:
+            return export_clusters(self._gateway, self._current_clustering(), self._dimensions)
+
+    def export_microclusters(self) -> np.ndarray:
+        """
+        Export the micro-clusters the clusterer currently maintains.
+
+        Centers and cluster features cross in one transfer per field rather
+        than one call per attribute, see
+        :func:`pymoa.models.clustering.snapshot.export_clusters`.
+
+        :return: A structured array with one record per micro-cluster.
+        """
+        self._ensure_java()
+        with self._clusterer_lock:
+            if not self._clusterer.implementsMicroClusterer():
+                raise ValueError(f"{type(self).__name__} does not maintain micro-clusters.")
+            return export_clusters(
+                self._gateway, self._clusterer.getMicroClusteringResult(), self._dimensions
+            )
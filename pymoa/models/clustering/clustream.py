@@ -15,10 +15,7 @@
 import logging
 from typing import Dict, List, Iterable, Any
 
-
-from pymoa.utils.utils import setup_logger, setup_java_gateway
-
-_LOGGER = setup_logger("clustree", logging.DEBUG)
+_LOGGER = logging.getLogger(__name__)
 
 
 from .base import BaseClustering
@@ -46,9 +43,7 @@ class Clustream(BaseClustering):
         self._max_num_kernels = max_num_kernels
         self._kernel_radius = kernel_radius
         self._k = k
-        self._gateway = setup_java_gateway(imports=_IMPORTS)
-        self._header = self._generate_header()
-        self._clusterer = self._initialize_clusterer()
+        self._java_imports = _IMPORTS
 
     @property
     def time_window(self) -> int:
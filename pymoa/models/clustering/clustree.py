@@ -15,10 +15,7 @@
 import logging
 from typing import Dict, List, Iterable, Any
 
-
-from pymoa.utils.utils import setup_logger, setup_java_gateway
-
-_LOGGER = setup_logger("clustree", logging.DEBUG)
+_LOGGER = logging.getLogger(__name__)
 
 
 from .base import BaseClustering
@@ -40,9 +37,8 @@ class Clustree(BaseClustering):
         super().__init__(dimensions, num_classes)
         self._window_range = window_range
         self._max_height = max_height
-        self._gateway = setup_java_gateway(imports=_IMPORTS)
-        self._header = self._generate_header()
-        self._clusterer = self._initialize_clusterer()
+        self._java_imports = _IMPORTS
+        self._sparse_instances = True
 
     @property
     def window_range(self) -> float:
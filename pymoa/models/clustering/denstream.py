@@ -15,10 +15,7 @@
 import logging
 from typing import Dict, List, Iterable, Any
 
-
-from pymoa.utils.utils import setup_logger, setup_java_gateway
-
-_LOGGER = setup_logger("dstream-with-dbscan", logging.DEBUG)
+_LOGGER = logging.getLogger(__name__)
 
 
 from .base import BaseClustering
@@ -55,9 +52,7 @@ class DenStreamWithDBSCAN(BaseClustering):
 
         self._lambda_ = lambda_
         self._processing_speed = processing_speed
-        self._gateway = setup_java_gateway(imports=_IMPORTS)
-        self._header = self._generate_header()
-        self._clusterer = self._initialize_clusterer()
+        self._java_imports = _IMPORTS
 
     @property
     def window_range(self) -> float:
@@ -0,0 +1,264 @@
+# Copyright 2023 Xin Han
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+from typing import Any
+
+import numpy as np
+from py4j.java_gateway import JavaGateway
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+_CHUNK_SIZE = 4096
+# Below this many clusters, or above this many dimensions, scanning every
+# cluster is as fast as searching a KD-tree over their centers.
+_INDEX_MIN_CLUSTERS = 256
+_INDEX_MAX_DIMENSIONS = 32
+# Candidates are searched slightly beyond the largest radius, so rounding never
+# drops a cluster the exhaustive scan would find covering a point.
+_INDEX_SLACK = 1e-9
+
+
+def export_dtype(dimensions: int) -> np.dtype:
+    """Record type of exported clusters, see :func:`export_clusters`."""
+    return np.dtype(
+        [
+            ("center", np.float64, (dimensions,)),
+            ("radius", np.float64),
+            ("weight", np.float64),
+            ("creation_time", np.float64),
+            ("last_update", np.float64),
+            ("n", np.float64),
+            ("cf1", np.float64, (dimensions,)),
+            ("cf2", np.float64, (dimensions,)),
+        ]
+    )
+
+
+def _read_vectors(gateway: JavaGateway, vectors: Any, num_vectors: int, dimensions: int) -> np.ndarray:
+    """
+    Read Java ``double[]`` vectors with one transfer.
+
+    The vectors are written into one JVM byte buffer, one call each, which is
+    read back as a whole instead of one call per attribute.
+    """
+    buffer = gateway.jvm.ByteBuffer.allocate(8 * num_vectors * dimensions)
+    buffer.order(gateway.jvm.ByteOrder.LITTLE_ENDIAN)
+    doubles = buffer.asDoubleBuffer()
+    for vector in vectors:
+        doubles.put(vector, 0, dimensions)
+    values = np.frombuffer(bytes(buffer.array()), dtype="<f8")
+    return values.reshape(num_vectors, dimensions)
+
+
+def export_clusters(gateway: JavaGateway, clustering: Any, dimensions: int) -> np.ndarray:
+    """
+    Export a ``moa.cluster.Clustering`` as a structured array, one record per cluster.
+
+    Every cluster has its ``center``, ``radius`` and ``weight``. Clusters
+    made of cluster features (CluStream, ClusTree and DenStream kernels) also
+    have their number of points ``n`` and the linear and squared sums
+    ``cf1`` and ``cf2``. DenStream micro-clusters have their
+    ``creation_time`` and ``last_update``; for CluStream kernels
+    ``last_update`` is the relevance stamp, the estimated time of their
+    recent points. Missing values are NaN.
+    """
+    num_clusters = 0 if clustering is None else clustering.size()
+    records = np.full(num_clusters, np.nan, dtype=export_dtype(dimensions))
+    if num_clusters == 0:
+        return records
+
+    clusters = [clustering.get(c) for c in range(num_clusters)]
+    records["center"] = _read_vectors(
+        gateway, (cluster.getCenter() for cluster in clusters), num_clusters, dimensions
+    )
+    for c, cluster in enumerate(clusters):
+        records["radius"][c] = cluster.getRadius()
+        records["weight"][c] = cluster.getWeight()
+
+    # Clusterers produce clusters of a single kind, so the first one tells.
+    Class = gateway.jvm.java.lang.Class
+    first = clusters[0]
+    if Class.forName("moa.cluster.CFCluster").isInstance(first):
+        records["cf1"] = _read_vectors(
+            gateway, (cluster.LS for cluster in clusters), num_clusters, dimensions
+        )
+        records["cf2"] = _read_vectors(
+            gateway, (cluster.SS for cluster in clusters), num_clusters, dimensions
+        )
+        for c, cluster in enumerate(clusters):
+            records["n"][c] = cluster.getN()
+    if Class.forName("moa.clusterers.denstream.MicroCluster").isInstance(first):
+        for c, cluster in enumerate(clusters):
+            records["creation_time"][c] = cluster.getCreationTime()
+            records["last_update"][c] = cluster.getLastEditTimestamp()
+    elif Class.forName("moa.clusterers.clustream.ClustreamKernel").isInstance(first):
+        for c, cluster in enumerate(clusters):
+            records["last_update"][c] = cluster.getRelevanceStamp()
+    return records
+
+
+class ClusteringSnapshot:
+    """Local copy of a MOA clustering used to predict without JVM calls."""
+
+    def __init__(self, centers: np.ndarray, radii: np.ndarray, weights: np.ndarray) -> None:
+        """
+        Initialize snapshot.
+
+        :param centers: Cluster centers, shape ``(n_clusters, dimensions)``.
+        :param radii: Cluster radii, shape ``(n_clusters,)``.
+        :param weights: Cluster weights, shape ``(n_clusters,)``.
+        """
+        self._centers = np.asarray(centers, dtype=np.float64)
+        self._radii = np.asarray(radii, dtype=np.float64)
+        self._weights = np.asarray(weights, dtype=np.float64)
+        self._centers_sq = np.einsum("ij,ij->i", self._centers, self._centers)
+        # A NaN or negative radius covers nothing, as ``distance <= radius``
+        # fails in the JVM, so such clusters get a squared radius no distance
+        # is within.
+        with np.errstate(invalid="ignore"):
+            self._radii_sq = np.where(self._radii >= 0, self._radii**2, -np.inf)
+        # Snapshots are rebuilt on every refresh, so is the index.
+        self._index = None
+        if len(self) >= _INDEX_MIN_CLUSTERS and self._centers.shape[1] <= _INDEX_MAX_DIMENSIONS:
+            self._index = cKDTree(self._centers)
+
+    @classmethod
+    def from_clustering(cls, gateway: JavaGateway, clustering: Any, dimensions: int) -> "ClusteringSnapshot":
+        """
+        Pull centers, radii and weights out of a ``moa.cluster.Clustering``.
+
+        Centers are written into one JVM byte buffer and read back with a single
+        transfer, so the cost is a few calls per cluster and none per attribute.
+        """
+        num_clusters = 0 if clustering is None else clustering.size()
+        if num_clusters == 0:
+            return cls(np.empty((0, dimensions)), np.empty(0), np.empty(0))
+
+        clusters = [clustering.get(c) for c in range(num_clusters)]
+        centers = _read_vectors(
+            gateway, (cluster.getCenter() for cluster in clusters), num_clusters, dimensions
+        )
+        radii = np.array([cluster.getRadius() for cluster in clusters], dtype=np.float64)
+        weights = np.array([cluster.getWeight() for cluster in clusters], dtype=np.float64)
+        return cls(centers, radii, weights)
+
+    @property
+    def centers(self) -> np.ndarray:
+        return self._centers
+
+    @property
+    def radii(self) -> np.ndarray:
+        return self._radii
+
+    @property
+    def weights(self) -> np.ndarray:
+        return self._weights
+
+    def __len__(self) -> int:
+        return self._centers.shape[0]
+
+    @property
+    def indexed(self) -> bool:
+        """Whether predictions search a KD-tree over the centers."""
+        return self._index is not None
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        Assign every row of ``X`` to the closest cluster that covers it.
+
+        A cluster covers a point when the distance to its center is within its
+        radius, as in ``SphereCluster.getInclusionProbability``. Ties go to the
+        highest cluster index and uncovered points get ``-1``, matching
+        :meth:`BaseClustering.predict_one`.
+
+        With many clusters, only those whose center lies within the largest
+        radius of a point are tested, found with a KD-tree over the centers.
+        """
+        if sparse.issparse(X):
+            X = sparse.csr_matrix(X, dtype=np.float64)
+        else:
+            X = np.asarray(X, dtype=np.float64)
+        labels = np.full(X.shape[0], -1, dtype=np.int64)
+        if len(self) == 0:
+            return labels
+
+        for start in range(0, X.shape[0], _CHUNK_SIZE):
+            block = X[start:start + _CHUNK_SIZE]
+            if self._index is not None:
+                labels[start:start + _CHUNK_SIZE] = self._predict_indexed(block)
+            else:
+                labels[start:start + _CHUNK_SIZE] = self._predict_exhaustive(block)
+        return labels
+
+    @staticmethod
+    def _squared_norms(block: Any) -> np.ndarray:
+        if sparse.issparse(block):
+            return np.asarray(block.multiply(block).sum(axis=1)).ravel()
+        return np.einsum("ij,ij->i", block, block)
+
+    def _predict_exhaustive(self, block: Any) -> np.ndarray:
+        """Test every cluster against every point of a block."""
+        num_clusters = len(self)
+        distances = (
+            self._squared_norms(block)[:, None]
+            - 2.0 * np.asarray(block @ self._centers.T)
+            + self._centers_sq[None, :]
+        )
+        np.maximum(distances, 0.0, out=distances)
+        distances[distances > self._radii_sq[None, :]] = np.inf
+
+        reversed_argmin = np.argmin(distances[:, ::-1], axis=1)
+        closest = num_clusters - 1 - reversed_argmin
+        covered = np.isfinite(distances[np.arange(block.shape[0]), closest])
+        return np.where(covered, closest, -1)
+
+    def _predict_indexed(self, block: Any) -> np.ndarray:
+        """Test only the clusters whose center is within the largest radius of a point."""
+        if sparse.issparse(block):
+            block = block.toarray()
+        labels = np.full(block.shape[0], -1, dtype=np.int64)
+        covering = self._radii_sq >= 0
+        if not covering.any():
+            return labels
+        max_radius = self._radii[covering].max()
+
+        candidates = self._index.query_ball_point(
+            block, max_radius * (1.0 + _INDEX_SLACK) + _INDEX_SLACK, return_sorted=False
+        )
+        counts = np.fromiter(map(len, candidates), dtype=np.int64, count=block.shape[0])
+        # Pairs of a point and a candidate cluster, grouped by point.
+        points = np.repeat(np.arange(block.shape[0]), counts)
+        clusters = np.fromiter(
+            itertools.chain.from_iterable(candidates), dtype=np.int64, count=points.shape[0]
+        )
+
+        # Same distances and inclusion test as the exhaustive scan, per pair.
+        distances = (
+            self._squared_norms(block)[points]
+            - 2.0 * np.einsum("ij,ij->i", block[points], self._centers[clusters])
+            + self._centers_sq[clusters]
+        )
+        np.maximum(distances, 0.0, out=distances)
+        inside = distances <= self._radii_sq[clusters]
+        points, clusters, distances = points[inside], clusters[inside], distances[inside]
+        if points.shape[0] == 0:
+            return labels
+
+        # Per point, the smallest distance and among equals the highest index.
+        starts = np.flatnonzero(np.r_[True, points[1:] != points[:-1]])
+        closest = np.minimum.reduceat(distances, starts)
+        ties = distances == np.repeat(closest, np.diff(np.r_[starts, points.shape[0]]))
+        labels[points[starts]] = np.maximum.reduceat(np.where(ties, clusters, -1), starts)
+        return labels
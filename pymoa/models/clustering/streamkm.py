@@ -15,11 +15,10 @@
 import logging
 from typing import Dict, List, Iterable, Any
 
+_LOGGER = logging.getLogger(__name__)
 
-from pymoa.utils.utils import setup_logger, setup_java_gateway
-
-_LOGGER = setup_logger("clustree", logging.DEBUG)
 
+from pymoa.metrics.metrics import F1_score_P, F1_score_R
 
 from .base import BaseClustering
 from .base import _IMPORTS
@@ -45,9 +44,8 @@ class StreamKM(BaseClustering):
         self._number_clusters = number_clusters
         self._length = length
         self._random_seed = random_seed
-        self._gateway = setup_java_gateway(imports=_IMPORTS)
-        self._header = self._generate_header()
-        self._clusterer = self._initialize_clusterer()
+        self._java_imports = _IMPORTS
+        self._sparse_instances = True
 
     @property
     def size_coreset(self) -> float:
@@ -81,13 +79,28 @@ class StreamKM(BaseClustering):
 
         return clusterer
 
-
-    def get_f1_score(self):
-        return self.f1_score(
-            self._found_clustering, self.gt_clustering, self.data_points
-        )
-        
-    def get_cmm_score(self):
-        return self.cmm_score(
-            self._found_clustering, self.gt_clustering, self.data_points
-        )
+    def get_f1_score(self, X: Iterable[Iterable[float]], lables: Iterable[int]) -> Dict[str, float]:
+        """
+        F1 scores of the current clustering on labelled points.
+
+        :param X: A 2-D array or an iterable of vectors.
+        :param lables: Class of every vector.
+        """
+        y_pred = self.predict_batch(X)
+        return {
+            "F1_P": F1_score_P(lables, y_pred),
+            "F1_R": F1_score_R(lables, y_pred),
+        }
+
+    def get_cmm_score(
+        self, X: Iterable[Iterable[float]], lables: Iterable[int], sample_size: int = None
+    ) -> Dict[str, float]:
+        """
+        CMM of the current clustering on labelled points, see
+        :meth:`BaseClustering.evaluate_cmm`.
+
+        :param X: A 2-D array or an iterable of vectors.
+        :param lables: Class of every vector.
+        :param sample_size: Optional number of points to evaluate on.
+        """
+        return self.evaluate_cmm(X, lables, sample_size=sample_size)
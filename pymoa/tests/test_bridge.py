@@ -0,0 +1,82 @@
+# Copyright 2023 Xin Han
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+
+# temporary solution for relative imports in case pyod is not installed
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from utils import bridge, daemon
+
+
+class TestBridge(unittest.TestCase):
+    def test_check_backend(self):
+        self.assertEqual(bridge.check_backend("py4j"), "py4j")
+        with self.assertRaises(ValueError):
+            bridge.check_backend("jni")
+        if bridge.jpype is None:
+            with self.assertRaises(ImportError):
+                bridge.check_backend("jpype")
+
+    def test_is_java_object(self):
+        self.assertFalse(bridge.is_java_object(np.zeros(3)))
+        self.assertFalse(bridge.is_java_object(None))
+
+    @unittest.skipIf(bridge.jpype is None, "JPype is not installed")
+    def test_to_java_array(self):
+        from utils.dependencies import get_class_path, _CLUSTERING_JARS
+
+        gateway = bridge.JPypeGateway(get_class_path(_CLUSTERING_JARS))
+        X = np.arange(6, dtype=np.float64).reshape(2, 3)
+        rows = gateway.to_java_array(X)
+        self.assertEqual([list(row) for row in rows], X.tolist())
+        indices = gateway.to_java_array(np.arange(4, dtype=np.int32))
+        self.assertEqual(list(indices), [0, 1, 2, 3])
+        with self.assertRaises(TypeError):
+            gateway.to_java_array(np.arange(4, dtype=np.int64))
+
+
+class TestDaemon(unittest.TestCase):
+    def test_parse_address(self):
+        self.assertEqual(daemon.parse_address(25335), ("127.0.0.1", 25335))
+        self.assertEqual(daemon.parse_address("10.0.0.2:4000"), ("10.0.0.2", 4000))
+
+    def test_not_running(self):
+        self.assertFalse(daemon.is_daemon_running("127.0.0.1:1"))
+
+    def test_auth_token(self):
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(
+            daemon, "_TOKEN_DIR", directory
+        ), mock.patch.dict(os.environ, {}, clear=True):
+            with self.assertRaises(RuntimeError):
+                daemon.read_token(4000)
+
+            daemon._write_token(4000, "secret")
+            self.assertEqual(os.stat(daemon.token_path(4000)).st_mode & 0o777, 0o600)
+            self.assertEqual(daemon.read_token("127.0.0.1:4000"), "secret")
+
+            os.environ["PYMOA_JVM_DAEMON_TOKEN"] = "other"
+            self.assertEqual(daemon.read_token(4000), "other")
+
+
+if __name__ == "__main__":
+    unittest.main()
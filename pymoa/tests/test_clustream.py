@@ -16,13 +16,18 @@
 
 import os
 import sys
+import tempfile
+import time
 import unittest
+from unittest import mock
 import numpy as np
+from scipy import sparse
 
 # noinspection PyProtectedMember
 from sklearn.datasets import load_iris, load_wine, load_diabetes
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.metrics import f1_score
+from sklearn.base import clone
 
 # temporary solution for relative imports in case pyod is not installed
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -30,7 +35,9 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")
 print(sys.path)
 
 from metrics.metrics import F1_score_P, F1_score_R, purity_score
+from metrics.prequential import PrequentialEvaluator
 from models.clustering.clustream import Clustream
+from pymoa.metrics import metrics as pymoa_metrics
 from sklearn.utils import shuffle
 from IsoKernel import IsoKernel
 
@@ -62,6 +69,189 @@ class TestDenStream(unittest.TestCase):
         print(f1_score_p)
         print(f1_score_r)
 
+    def test_fit_predict_iter(self):
+        dense = self.data.toarray() if sparse.issparse(self.data) else np.asarray(self.data)
+        chunks = list(self.clf.fit_predict_iter(dense, self.lables, chunk_size=50))
+        self.assertEqual([len(chunk) for chunk in chunks], [50, 50, 50, len(dense) - 150])
+        for chunk in chunks:
+            self.assertIsInstance(chunk, np.ndarray)
+            self.assertEqual(chunk.dtype, np.int64)
+        self.assertEqual(self.clf._m_timestamp, len(dense))
+
+        # A plain generator of vectors is read chunk by chunk.
+        clf = clone(self.clf)
+        rows = (row for row in dense)
+        chunks = list(clf.fit_predict_iter(rows, chunk_size=64))
+        self.assertEqual([len(chunk) for chunk in chunks], [64, 64, len(dense) - 128])
+        self.assertEqual(clf._m_timestamp, len(dense))
+
+        # Every chunk's instances were released on the JVM.
+        for model in (self.clf, clf):
+            self.assertEqual(model._instances, [])
+            self.assertIsNone(model.last_instance)
+
+    def test_empty_batch(self):
+        self.clf.learn_batch([])
+        self.assertEqual(self.clf.predict_batch([]), [])
+        self.assertEqual(self.clf.fit_predict(np.empty((0, self.data.shape[1]))), [])
+
+    def test_transfer_blocks(self):
+        blocked = clone(self.clf)
+        self.clf.learn_batch(self.data)
+        # Seven rows per block.
+        with mock.patch("models.clustering.base._TRANSFER_BYTES", 7 * 8 * self.data.shape[1]):
+            blocked.learn_batch(self.data)
+            self.assertEqual(blocked.fit_predict(self.data[:20]), self.clf.fit_predict(self.data[:20]))
+        self.assertEqual(blocked._m_timestamp, self.clf._m_timestamp)
+        self.assertIsNone(blocked.last_instance)
+
+    def test_wire_dtype(self):
+        with self.assertRaises(ValueError):
+            self.clf.set_wire_dtype("int8")
+
+        self.clf.set_wire_dtype("int16", sample=self.data)
+        pred_labels = self.clf.fit_predict(self.data, lables=self.lables)
+        self.assertEqual(len(pred_labels), len(self.lables))
+
+        # Classes are not learned: kernels keep the data dimensionality and
+        # predictions do not depend on them.
+        kernel = self.clf._clusterer.getMicroClusteringResult().get(0)
+        self.assertEqual(len(kernel.getCenter()), self.data.shape[1])
+        unlabelled = clone(self.clf).set_wire_dtype("int16", sample=self.data)
+        self.assertEqual(unlabelled.fit_predict(self.data), pred_labels)
+
+    def test_warm_up(self):
+        expected = self.clf.fit_predict(self.data)
+
+        clf = Clustream(
+            dimensions=len(self.data[0]),
+            num_classes=3,
+            time_window=50,
+            max_num_kernels=5,
+            kernel_radius=8,
+            k=3,
+        )
+        clf.warm_up(num_points=500)
+        self.assertEqual(clf.fit_predict(self.data), expected)
+
+    def test_refresh_policy(self):
+        self.clf.set_refresh_policy(every_n=10)
+        self.clf.learn_batch(self.data[:100])
+        self.clf.predict_batch(self.data[:1])
+        clustering = self.clf.found_clustering
+        self.assertFalse(self.clf._is_stale())
+
+        self.clf.learn_batch(self.data[100:109])
+        self.assertFalse(self.clf._is_stale())
+        self.clf.predict_batch(self.data[:1])
+        self.assertIs(self.clf.found_clustering, clustering)
+
+        self.clf.learn_batch(self.data[109:110])
+        self.assertTrue(self.clf._is_stale())
+        self.clf.predict_batch(self.data[:1])
+        self.assertIsNot(self.clf.found_clustering, clustering)
+
+        self.clf.set_refresh_policy(every_n=None, every_seconds=0.2)
+        clustering = self.clf.found_clustering
+        self.clf.learn_batch(self.data[110:120])
+        self.assertFalse(self.clf._is_stale())
+        time.sleep(0.3)
+        self.assertTrue(self.clf._is_stale())
+
+        self.clf.set_refresh_policy(every_n=None, every_seconds=None)
+        self.assertFalse(self.clf._is_stale())
+        self.clf.refresh()
+        self.assertIsNot(self.clf.found_clustering, clustering)
+
+    def test_background_refresh(self):
+        self.clf.set_refresh_policy(every_n=10)
+        self.clf.enable_background_refresh()
+        self.assertTrue(self.clf.background_refresh)
+        self.clf.learn_batch(self.data[:100])
+        self.clf.predict_batch(self.data[:1])
+        clustering = self.clf.found_clustering
+
+        deadline = time.monotonic() + 30
+        start = 100
+        while self.clf.found_clustering is clustering and time.monotonic() < deadline:
+            self.clf.learn_batch(self.data[start % len(self.lables):][:10])
+            self.clf.predict_batch(self.data[:1])
+            start += 10
+        self.assertIsNot(self.clf.found_clustering, clustering)
+
+        self.clf.enable_background_refresh(False)
+        self.assertFalse(self.clf.background_refresh)
+
+    def test_save_load(self):
+        self.clf.set_refresh_policy(every_n=20)
+        self.clf.enable_local_predict()
+        self.clf.learn_batch(self.data)
+        expected = self.clf.predict_batch(self.data)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "clustream.npz")
+            self.clf.save(path)
+            clf = Clustream.load(path)
+
+        self.assertEqual(clf._m_timestamp, self.clf._m_timestamp)
+        self.assertEqual(clf.get_params(), self.clf.get_params())
+        self.assertEqual(clf._refresh_every_n, 20)
+        self.assertTrue(clf.local_predict)
+        self.assertEqual(clf.predict_batch(self.data), expected)
+
+    def test_prequential(self):
+        evaluator = PrequentialEvaluator(self.clf, chunk_size=50, window_size=100)
+        reports = list(evaluator.evaluate(self.data, self.lables))
+        self.assertEqual(reports[-1]["instances"], len(self.lables))
+        self.assertEqual(reports[-1]["window"], 100)
+        self.assertIn("purity", reports[-1])
+
+    def test_evaluate_cmm(self):
+        self.clf.learn_batch(self.data)
+        scores = self.clf.evaluate_cmm(self.data, self.lables)
+        self.assertIn("CMM", scores)
+        self.assertTrue(0 <= scores["CMM"] <= 1)
+        evaluator = pymoa_metrics._CMM_EVALUATORS[self.clf.gateway]
+
+        sampled = self.clf.evaluate_cmm(self.data, self.lables, sample_size=50, random_seed=0)
+        self.assertIn("CMM", sampled)
+        self.assertTrue(0 <= sampled["CMM"] <= 1)
+        self.assertIs(pymoa_metrics._CMM_EVALUATORS[self.clf.gateway], evaluator)
+        self.assertEqual(
+            self.clf.evaluate_cmm(self.data, self.lables, sample_size=50, random_seed=0), sampled
+        )
+        self.assertIsNone(self.clf.last_instance)
+
+    def test_gateway_reused(self):
+        self.clf.fit_predict(self.data)
+        gateway = self.clf.gateway
+        self.clf.close()
+
+        clf = clone(self.clf)
+        clf.fit_predict(self.data)
+        self.assertIs(clf.gateway, gateway)
+        clf.close()
+
+    def test_sparse_input(self):
+        dense = self.data.toarray() if sparse.issparse(self.data) else np.asarray(self.data)
+        sparse_clf = clone(self.clf)
+        self.clf.learn_batch(dense)
+        sparse_clf.learn_batch(sparse.csr_matrix(dense))
+
+        expected = self.clf.export_microclusters()
+        kernels = sparse_clf.export_microclusters()
+        self.assertEqual(kernels["center"].shape, expected["center"].shape)
+        self.assertTrue(np.allclose(kernels["center"], expected["center"]))
+        self.assertTrue(np.allclose(kernels["n"], expected["n"]))
+
+    def test_export_microclusters(self):
+        self.clf.fit_predict(self.data)
+        kernels = self.clf.export_microclusters()
+        self.assertEqual(kernels["center"].shape, (kernels.shape[0], len(self.data[0])))
+        self.assertTrue(0 < kernels.shape[0] <= 5)
+        self.assertTrue(np.allclose(kernels["cf1"] / kernels["n"][:, None], kernels["center"]))
+        self.assertFalse(np.isnan(kernels["last_update"]).any())
+
 
 if __name__ == "__main__":
     unittest.main()
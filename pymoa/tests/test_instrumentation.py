@@ -0,0 +1,54 @@
+# Copyright 2023 Xin Han
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+# temporary solution for relative imports in case pyod is not installed
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from utils.instrumentation import Instrumentation
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        self.probe = Instrumentation(callback=lambda *event: self.events.append(event))
+
+    def test_record(self):
+        self.probe.record("train", 2e-6)
+        self.probe.record("train", 4e-3)
+        self.probe.record("instance", 1e-2, count=100)
+
+        stats = self.probe.stats()
+        self.assertEqual(stats["train"]["calls"], 2)
+        self.assertEqual(stats["train"]["count"], 2)
+        self.assertAlmostEqual(stats["train"]["max"], 4e-3)
+        self.assertAlmostEqual(stats["train"]["mean"], (2e-6 + 4e-3) / 2)
+        self.assertEqual(sum(stats["train"]["histogram"]), 2)
+        self.assertEqual(stats["instance"]["count"], 100)
+        self.assertEqual(self.events[-1], ("instance", 1e-2, 100))
+
+    def test_reset(self):
+        self.probe.record("predict", 1e-3)
+        self.probe.reset()
+        self.assertEqual(self.probe.stats(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
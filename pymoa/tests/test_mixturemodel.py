@@ -0,0 +1,154 @@
+# Copyright 2023 Xin Han
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+
+# temporary solution for relative imports in case pyod is not installed
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../data/generators/mixturemodel"))
+)
+
+import ConceptMixtureModel as concept_module
+from ConceptMixtureModel import ConceptMixtureModel, hellinger_distance
+from MixtureModel import MixtureModel
+from MultiDriftMixtureModel import Drift, MultiDriftMixtureModel
+
+
+class TestMixtureModel(unittest.TestCase):
+    def setUp(self):
+        self.mm = MixtureModel(
+            num_classes=3, num_attributes=4, instance_random_seed=1, model_random_seed=2
+        )
+
+    def test_next_batch(self):
+        points, y = self.mm.next_batch(200000)
+        self.assertEqual(points.shape, (200000, 4))
+        self.assertEqual(y.shape, (200000,))
+
+        for i in range(self.mm.get_num_models()):
+            component = points[y == i]
+            self.assertAlmostEqual(len(component) / len(points), self.mm.get_weight(i), places=2)
+            np.testing.assert_allclose(component.mean(axis=0), self.mm.get_means(i), atol=0.02)
+            np.testing.assert_allclose(np.cov(component.T), self.mm.get_covariance(i), atol=0.05)
+
+    def test_next_batch_reproducible(self):
+        other = MixtureModel(
+            num_classes=3, num_attributes=4, instance_random_seed=1, model_random_seed=2
+        )
+        points, y = self.mm.next_batch(1000)
+        other_points, other_y = other.next_batch(1000)
+        np.testing.assert_array_equal(points, other_points)
+        np.testing.assert_array_equal(y, other_y)
+
+    def test_density_at_batch(self):
+        points, _ = self.mm.next_batch(1000)
+        expected = sum(
+            self.mm.get_weight(i) * self.mm.model_array[i].pdf(points)
+            for i in range(self.mm.get_num_models())
+        )
+        np.testing.assert_allclose(self.mm.density_at_batch(points), expected, rtol=1e-8)
+        np.testing.assert_allclose(
+            self.mm.log_density_at_batch(points), np.log(expected), rtol=1e-8
+        )
+        self.assertAlmostEqual(self.mm.density_at(points[0]), expected[0])
+
+    def test_means_per_component(self):
+        means = [self.mm.get_means(i) for i in range(self.mm.get_num_models())]
+        self.assertFalse(np.allclose(means[0], means[1]))
+
+
+class TestMultiDriftMixtureModel(unittest.TestCase):
+    def setUp(self):
+        self.drifts = [Drift(1000, 0, 1), Drift(2000, 1000, 2), Drift(4000, 0, 0)]
+        self.scenario = MultiDriftMixtureModel.from_seeds(
+            num_atts=3,
+            num_classes=3,
+            num_concepts=3,
+            drift_magnitude=0.5,
+            drifts=self.drifts,
+            model_random_seed=2,
+            instance_random_seed=1,
+        )
+
+    def test_schedule(self):
+        _, _, concepts = self.scenario.next_batch(5000)
+        self.assertTrue(np.all(concepts[:1000] == 0))
+        self.assertTrue(np.all(concepts[1000:2000] == 1))
+        self.assertTrue(set(np.unique(concepts[2000:3000])) == {1, 2})
+        self.assertLess(np.mean(concepts[2000:2500] == 2), np.mean(concepts[2500:3000] == 2))
+        self.assertTrue(np.all(concepts[3000:4000] == 2))
+        self.assertTrue(np.all(concepts[4000:] == 0))
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = self.scenario.write(os.path.join(directory, "stream"), 2500, block_size=1000)
+            X = np.load(paths[0], mmap_mode="r")
+            y = np.load(paths[1], mmap_mode="r")
+            self.assertEqual(X.shape, (2500, 3))
+            self.assertEqual(y.shape, (2500,))
+            self.assertTrue(np.all(np.load(paths[2])[1000:2000] == 1))
+            del X, y
+
+    def test_overlapping_drifts(self):
+        with self.assertRaises(ValueError):
+            MultiDriftMixtureModel(self.scenario.concepts, [Drift(10, 20, 1), Drift(20, 0, 2)], 1)
+
+
+class TestConceptMixtureModel(unittest.TestCase):
+    def setUp(self):
+        self.params = dict(
+            num_atts=2,
+            num_classes_pre=2,
+            burn_in_instances=10,
+            drift_duration=100,
+            drift_magnitude=0.5,
+            precision_drift_magnitude=0.05,
+            num_classes_post=2,
+            model_random_seed=42,
+            instance_random_seed=42,
+        )
+
+    def test_hellinger_distance(self):
+        mm1 = MixtureModel(num_classes=2, num_attributes=2, instance_random_seed=1, model_random_seed=2)
+        mm2 = MixtureModel(num_classes=2, num_attributes=2, instance_random_seed=3, model_random_seed=4)
+        self.assertAlmostEqual(hellinger_distance(mm1, mm1, 1.0, 6.0, 7), 0.0, places=2)
+
+        distance = hellinger_distance(mm1, mm2, 0.0, 6.0, 7)
+        self.assertTrue(0.0 < distance <= 1.0)
+        self.assertEqual(hellinger_distance(mm1, mm2, 0.0, 6.0, 7), distance)
+
+    def test_same_drift_for_any_n_jobs(self):
+        models = [ConceptMixtureModel(n_jobs=n_jobs, **self.params) for n_jobs in (1, 2)]
+        posts = [model._mixture_model_post for model in models]
+        for i in range(posts[0].get_num_models()):
+            np.testing.assert_array_equal(posts[0].get_means(i), posts[1].get_means(i))
+            self.assertEqual(posts[0].get_weight(i), posts[1].get_weight(i))
+
+    def test_max_retries(self):
+        self.params["precision_drift_magnitude"] = 0.0
+        with mock.patch.object(concept_module, "_MAX_CANDIDATE", 2):
+            with self.assertWarns(UserWarning):
+                model = ConceptMixtureModel(n_jobs=1, max_retries=2, **self.params)
+        self.assertIsNotNone(model._mixture_model_post)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+# Copyright 2023 Xin Han
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+import numpy as np
+
+# temporary solution for relative imports in case pyod is not installed
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from metrics.metrics import purity_score
+from metrics.prequential import PrequentialEvaluator
+
+
+class NearestCenter:
+    """
+    Leader clustering: a point farther than ``radius`` from every center
+    starts a new one. Labels points by their closest center, -1 before any
+    learning. Like a MOA clusterer, it never sees the classes.
+    """
+
+    def __init__(self, radius=1.0):
+        self.radius = radius
+        self.centers = []
+        self.calls = []
+
+    def predict_batch(self, X, lables=None):
+        self.calls.append(("predict", X.shape[0]))
+        if not self.centers:
+            return [-1] * X.shape[0]
+        centers = np.array(self.centers)
+        distances = ((X[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        return np.argmin(distances, axis=1).tolist()
+
+    def learn_batch(self, X, lables=None):
+        if lables is not None:
+            raise AssertionError("A clusterer must not learn the classes.")
+        self.calls.append(("learn", X.shape[0]))
+        for x in X:
+            if not self.centers or min(np.linalg.norm(x - c) for c in self.centers) > self.radius:
+                self.centers.append(x)
+        return self
+
+
+class TestPrequentialEvaluator(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.y = rng.randint(0, 3, size=1000)
+        self.X = rng.normal(size=(1000, 2)) * 0.1 + self.y[:, None] * 5.0
+
+    def test_test_then_train(self):
+        estimator = NearestCenter()
+        evaluator = PrequentialEvaluator(estimator, chunk_size=300, window_size=500)
+        reports = list(evaluator.evaluate(self.X, self.y))
+
+        self.assertEqual([r["instances"] for r in reports], [300, 600, 900, 1000])
+        self.assertEqual([r["window"] for r in reports], [300, 500, 500, 500])
+        self.assertIn("ARI", reports[-1])
+        self.assertIn("NMI", reports[-1])
+        self.assertEqual(estimator.calls[:2], [("predict", 300), ("learn", 300)])
+        self.assertEqual(estimator.calls[-2:], [("predict", 100), ("learn", 100)])
+        # Nothing is learned before the first chunk is predicted.
+        self.assertAlmostEqual(reports[0]["purity"], purity_score(self.y[:300], [-1] * 300))
+        self.assertEqual(reports[-1]["purity"], 1.0)
+        self.assertEqual(reports[-1]["F1_P"], 1.0)
+        self.assertEqual(reports[-1]["F1_R"], 1.0)
+        for report in reports:
+            self.assertGreater(report["throughput"], 0)
+            self.assertGreaterEqual(report["predict_latency"], 0)
+            self.assertGreaterEqual(report["learn_latency"], 0)
+
+    def test_fading_window(self):
+        evaluator = PrequentialEvaluator(
+            NearestCenter(), chunk_size=250, window="fading", window_size=1000, fading_factor=0.99
+        )
+        reports = list(evaluator.evaluate(self.X, self.y))
+        self.assertNotIn("ARI", reports[-1])
+
+        # The unlearned first chunk has faded out of the window.
+        self.assertLess(reports[1]["purity"], 1.0)
+        self.assertGreater(reports[-1]["purity"], 0.999)
+
+    def test_invalid_window(self):
+        with self.assertRaises(ValueError):
+            PrequentialEvaluator(NearestCenter(), window="tumbling")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+# Copyright 2023 Xin Han
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+import numpy as np
+from scipy import sparse
+
+# temporary solution for relative imports in case pyod is not installed
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from models.clustering.snapshot import ClusteringSnapshot
+
+
+def predict_one_reference(centers, radii, x):
+    """Same loop as BaseClustering.predict_one over a JVM clustering."""
+    covered = False
+    label = 0
+    min_distance = np.inf
+    for c in range(len(centers)):
+        x_distance = np.sqrt(np.sum((x - centers[c]) ** 2))
+        if x_distance <= radii[c]:
+            if x_distance <= min_distance:
+                label = c
+                min_distance = x_distance
+            covered = True
+    if not covered:
+        label = -1
+    return label
+
+
+class TestClusteringSnapshot(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        self.centers = rng.rand(20, 5)
+        self.radii = rng.rand(20) * 0.4
+        self.weights = rng.rand(20)
+        self.data = rng.rand(500, 5)
+        self.snapshot = ClusteringSnapshot(self.centers, self.radii, self.weights)
+
+    def test_predict(self):
+        expected = [predict_one_reference(self.centers, self.radii, x) for x in self.data]
+        np.testing.assert_array_equal(self.snapshot.predict(self.data), expected)
+
+    def test_predict_sparse(self):
+        data = np.where(self.data > 0.5, self.data, 0.0)
+        np.testing.assert_array_equal(
+            self.snapshot.predict(sparse.csr_matrix(data)), self.snapshot.predict(data)
+        )
+
+    def test_predict_ties_and_empty(self):
+        snapshot = ClusteringSnapshot(np.zeros((2, 2)), np.ones(2), np.ones(2))
+        np.testing.assert_array_equal(snapshot.predict([[0.5, 0.0], [3.0, 3.0]]), [1, -1])
+
+        empty = ClusteringSnapshot(np.empty((0, 2)), np.empty(0), np.empty(0))
+        np.testing.assert_array_equal(empty.predict(np.zeros((3, 2))), [-1, -1, -1])
+
+    def test_predict_indexed(self):
+        rng = np.random.RandomState(0)
+        centers = rng.rand(400, 3)
+        radii = rng.rand(400) * 0.1
+        data = rng.rand(300, 3)
+        snapshot = ClusteringSnapshot(centers, radii, np.ones(400))
+        self.assertTrue(snapshot.indexed)
+
+        expected = [predict_one_reference(centers, radii, x) for x in data]
+        np.testing.assert_array_equal(snapshot.predict(data), expected)
+        np.testing.assert_array_equal(snapshot.predict(sparse.csr_matrix(data)), expected)
+
+    def test_predict_indexed_ties(self):
+        snapshot = ClusteringSnapshot(np.zeros((300, 2)), np.ones(300), np.ones(300))
+        self.assertTrue(snapshot.indexed)
+        np.testing.assert_array_equal(snapshot.predict([[0.5, 0.0], [3.0, 3.0]]), [299, -1])
+
+
+    def test_predict_nan_radii(self):
+        rng = np.random.RandomState(0)
+        data = rng.rand(300, 3)
+        for num_clusters in (20, 400):
+            centers = rng.rand(num_clusters, 3)
+            radii = rng.rand(num_clusters) * 0.2
+            radii[::3] = np.nan
+            snapshot = ClusteringSnapshot(centers, radii, np.ones(num_clusters))
+            self.assertEqual(snapshot.indexed, num_clusters == 400)
+
+            expected = [predict_one_reference(centers, radii, x) for x in data]
+            self.assertGreater(np.count_nonzero(np.asarray(expected) >= 0), 0)
+            np.testing.assert_array_equal(snapshot.predict(data), expected)
+
+        snapshot = ClusteringSnapshot(np.zeros((300, 2)), np.full(300, np.nan), np.ones(300))
+        np.testing.assert_array_equal(snapshot.predict(np.zeros((2, 2))), [-1, -1])
+
+if __name__ == "__main__":
+    unittest.main()
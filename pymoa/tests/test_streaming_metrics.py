@@ -0,0 +1,153 @@
+# Copyright 2023 Xin Han
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+import numpy as np
+from scipy import sparse
+
+# temporary solution for relative imports in case pyod is not installed
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from sklearn import metrics as sk_metrics
+
+from metrics.metrics import (
+    F1_score_P,
+    F1_score_R,
+    adjusted_rand_score,
+    get_contingency_matrix,
+    purity_score,
+)
+from metrics.streaming import ReservoirSample, StreamingClusteringMetrics
+
+
+def batch_scores(y_true, y_pred, sample_weight=None):
+    return {
+        "purity": purity_score(y_true, y_pred, sample_weight=sample_weight),
+        "F1_P": F1_score_P(y_true, y_pred, sample_weight=sample_weight),
+        "F1_R": F1_score_R(y_true, y_pred, sample_weight=sample_weight),
+    }
+
+
+class TestStreamingClusteringMetrics(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.y_true = rng.randint(0, 4, size=2000)
+        # Clusters agree with classes more and more along the stream.
+        noise = rng.randint(-1, 6, size=2000)
+        self.y_pred = np.where(rng.random_sample(2000) < np.linspace(0, 1, 2000), self.y_true, noise)
+
+    def update_in_chunks(self, metrics, chunk_size=300):
+        for start in range(0, 2000, chunk_size):
+            metrics.update(self.y_true[start:start + chunk_size], self.y_pred[start:start + chunk_size])
+        return metrics.scores()
+
+    def assertScoresEqual(self, scores, expected):
+        for name, value in expected.items():
+            self.assertAlmostEqual(scores[name], value, msg=name)
+
+    def test_all_points(self):
+        scores = self.update_in_chunks(StreamingClusteringMetrics())
+        expected = batch_scores(self.y_true, self.y_pred)
+        expected["ARI"] = sk_metrics.adjusted_rand_score(self.y_true, self.y_pred)
+        expected["NMI"] = sk_metrics.normalized_mutual_info_score(self.y_true, self.y_pred)
+        self.assertScoresEqual(scores, expected)
+
+    def test_sliding_window(self):
+        metrics = StreamingClusteringMetrics(window_size=700)
+        scores = self.update_in_chunks(metrics)
+        expected = batch_scores(self.y_true[-700:], self.y_pred[-700:])
+        expected["ARI"] = sk_metrics.adjusted_rand_score(self.y_true[-700:], self.y_pred[-700:])
+        self.assertScoresEqual(scores, expected)
+        self.assertEqual(metrics.weight, 700)
+
+    def test_fading(self):
+        metrics = StreamingClusteringMetrics(fading_factor=0.995)
+        scores = self.update_in_chunks(metrics, chunk_size=128)
+        sample_weight = 0.995 ** np.arange(1999, -1, -1)
+        self.assertScoresEqual(scores, batch_scores(self.y_true, self.y_pred, sample_weight))
+        self.assertAlmostEqual(metrics.weight, sample_weight.sum())
+
+    def test_fading_leaves_out_ari(self):
+        metrics = StreamingClusteringMetrics(fading_factor=0.995)
+        scores = self.update_in_chunks(metrics)
+        self.assertNotIn("ARI", scores)
+        self.assertIn("NMI", scores)
+        with self.assertRaises(ValueError):
+            metrics.adjusted_rand()
+        with self.assertRaises(ValueError):
+            adjusted_rand_score(contingency=metrics.contingency_matrix())
+
+    def test_fading_large_chunk(self):
+        y_true = np.tile(self.y_true, 50)
+        y_pred = np.tile(self.y_pred, 50)
+        metrics = StreamingClusteringMetrics(fading_factor=0.99)
+        scores = metrics.update(y_true, y_pred).scores()
+        # Older points weigh nothing at this decay, so the last ones decide.
+        sample_weight = 0.99 ** np.arange(1999, -1, -1)
+        self.assertScoresEqual(scores, batch_scores(self.y_true, self.y_pred, sample_weight))
+        self.assertAlmostEqual(metrics.weight, 1 / (1 - 0.99))
+
+
+class TestContingencyMetrics(unittest.TestCase):
+    def test_sparse_contingency(self):
+        rng = np.random.RandomState(1)
+        y_true = rng.randint(0, 5, size=500)
+        y_pred = rng.randint(-1, 40, size=500)
+        ctm = get_contingency_matrix(y_true, y_pred)
+        np.testing.assert_array_equal(ctm, sk_metrics.cluster.contingency_matrix(y_true, y_pred))
+
+        for score in (purity_score, F1_score_P, F1_score_R):
+            expected = score(y_true, y_pred)
+            self.assertAlmostEqual(score(contingency=ctm), expected)
+            self.assertAlmostEqual(score(contingency=sparse.csr_matrix(ctm)), expected)
+
+    def test_F1_ties(self):
+        # Cluster 0 is split evenly, it is matched with the first class.
+        y_true = np.array([0, 0, 1, 1, 1, 1, 1])
+        y_pred = np.array([0, 1, 0, 1, 1, 1, 1])
+        self.assertAlmostEqual(F1_score_P(y_true, y_pred), (2 / 4 + 8 / 10) / 2)
+
+
+class TestReservoirSample(unittest.TestCase):
+    def test_bounded_uniform_sample(self):
+        X = np.arange(20000, dtype=np.float64).reshape(10000, 2)
+        y = np.arange(10000) % 3
+        counts = np.zeros(10000)
+        for seed in range(200):
+            reservoir = ReservoirSample(100, random_seed=seed)
+            for start in range(0, 10000, 700):
+                reservoir.update(X[start:start + 700], y[start:start + 700], np.arange(start, start + 700))
+            self.assertEqual(len(reservoir), 100)
+            self.assertEqual(len(np.unique(reservoir.timestamps)), 100)
+            np.testing.assert_array_equal(reservoir.X[:, 0], 2 * reservoir.timestamps)
+            np.testing.assert_array_equal(reservoir.y, reservoir.timestamps % 3)
+            counts[reservoir.timestamps] += 1
+
+        # Every point is kept with probability 100 / 10000, early or late.
+        self.assertAlmostEqual(counts[:5000].sum() / counts.sum(), 0.5, delta=0.02)
+
+    def test_partial_sample(self):
+        reservoir = ReservoirSample(10, random_seed=0)
+        reservoir.update(sparse.csr_matrix(np.eye(4)), [0, 1, 2, 3], [5, 6, 7, 8])
+        np.testing.assert_array_equal(reservoir.X, np.eye(4))
+        np.testing.assert_array_equal(reservoir.timestamps, [5, 6, 7, 8])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -66,5 +66,15 @@ class TestDenStream(unittest.TestCase):
         print(f1_score_r)
 
 
+    def test_get_cmm_score(self):
+        self.clf.learn_batch(self.data)
+        scores = self.clf.get_cmm_score(self.data, self.lables)
+        self.assertIn("CMM", scores)
+        self.assertTrue(0 <= scores["CMM"] <= 1)
+
+        sampled = self.clf.get_cmm_score(self.data, self.lables, sample_size=50)
+        self.assertIn("CMM", sampled)
+        self.assertTrue(0 <= sampled["CMM"] <= 1)
+
 if __name__ == "__main__":
     unittest.main()
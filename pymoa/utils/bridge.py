@@ -0,0 +1,136 @@
+"""Bridges between Python and the JVM."""
+import os
+from typing import Any, Dict, Iterable
+
+import numpy as np
+from py4j.java_gateway import JavaObject
+from py4j.java_gateway import java_import as py4j_java_import
+
+try:
+    import jpype
+except ImportError:  # pragma: no cover
+    jpype = None
+
+# Bridge used when none is asked for, overridable with PYMOA_JAVA_BACKEND.
+_DEFAULT_BACKEND = os.environ.get("PYMOA_JAVA_BACKEND", "py4j")
+
+_BACKENDS = ("py4j", "jpype")
+
+_JPYPE_PRIMITIVES = {
+    "boolean": "JBoolean",
+    "byte": "JByte",
+    "char": "JChar",
+    "short": "JShort",
+    "int": "JInt",
+    "long": "JLong",
+    "float": "JFloat",
+    "double": "JDouble",
+}
+
+
+def set_default_backend(backend: str) -> None:
+    """
+    Choose the bridge estimators use, ``"py4j"`` or ``"jpype"``.
+
+    It applies the next time the shared gateway is launched.
+    """
+    global _DEFAULT_BACKEND
+    _DEFAULT_BACKEND = check_backend(backend)
+
+
+def check_backend(backend: str) -> str:
+    """Resolve and validate a bridge name, ``None`` meaning the default one."""
+    if backend is None:
+        backend = _DEFAULT_BACKEND
+    if backend not in _BACKENDS:
+        raise ValueError(f"backend must be one of {_BACKENDS}, got {backend!r}.")
+    if backend == "jpype" and jpype is None:
+        raise ImportError("The jpype backend needs JPype, install it with `pip install JPype1`.")
+    return backend
+
+
+class _JPypeJVMView:
+    """Mimics ``JavaGateway.jvm``: imported classes by simple name, the rest by package."""
+
+    def __init__(self) -> None:
+        self._classes: Dict[str, Any] = {}
+
+    def _import(self, path: str) -> None:
+        self._classes[path.rsplit(".", 1)[-1]] = jpype.JClass(path)
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in _JPYPE_PRIMITIVES:
+            return getattr(jpype, _JPYPE_PRIMITIVES[name])
+        if name in self._classes:
+            return self._classes[name]
+        return jpype.JPackage(name)
+
+
+class JPypeGateway:
+    """
+    In-process JVM with the parts of the ``JavaGateway`` interface pymoa uses.
+
+    Calls are plain JNI calls instead of socket round trips, and NumPy arrays
+    are copied straight into Java arrays, see :meth:`to_java_array`. The JVM lives as long as the process: a
+    JVM cannot be restarted in-process, so :meth:`shutdown` keeps it running
+    for the next gateway and the class path is the one of the first launch.
+    """
+
+    def __init__(self, class_path: str, java_options: Iterable[str] = ()) -> None:
+        """
+        Start the JVM, unless it already runs.
+
+        :param class_path: Classpath of the JVM.
+        :param java_options: Options of the JVM.
+        """
+        if not jpype.isJVMStarted():
+            jpype.startJVM(
+                *java_options, classpath=class_path.split(os.pathsep), convertStrings=True
+            )
+        self._jvm = _JPypeJVMView()
+
+    @property
+    def jvm(self) -> Any:
+        return self._jvm
+
+    def java_import(self, path: str) -> None:
+        self._jvm._import(path)
+
+    def new_array(self, java_class: Any, *dimensions: int) -> Any:
+        return jpype.JArray(java_class, len(dimensions))(*dimensions)
+
+    def to_java_array(self, values: np.ndarray) -> Any:
+        """
+        Copy a C-contiguous float64 or int32 array into a Java array of the same shape.
+
+        JPype reads the array through the buffer protocol, so the values are
+        copied once, straight into the ``double[]`` or ``int[]``. A 2-D array
+        becomes a ``double[][]`` whose rows are used as they are.
+        """
+        java_types = {np.dtype(np.float64): jpype.JDouble, np.dtype(np.int32): jpype.JInt}
+        if values.dtype not in java_types:
+            raise TypeError(f"Only float64 and int32 arrays are supported, got {values.dtype}.")
+        return jpype.JArray(java_types[values.dtype], values.ndim)(values)
+
+    def detach(self, java_object: Any) -> None:
+        """Nothing to do, the JVM collects objects Python no longer references."""
+
+    def shutdown(self) -> None:
+        """Nothing to do, see the class documentation."""
+
+
+def java_import(gateway: Any, path: str) -> None:
+    """Import a class by its fully qualified path into the view of a gateway."""
+    if isinstance(gateway, JPypeGateway):
+        gateway.java_import(path)
+    else:
+        py4j_java_import(gateway.jvm, path)
+
+
+def is_java_object(value: Any) -> bool:
+    """Whether a value is a reference to a JVM object, on any bridge."""
+    if isinstance(value, JavaObject):
+        return True
+    return jpype is not None and isinstance(value, jpype.JObject)
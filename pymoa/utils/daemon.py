@@ -0,0 +1,327 @@
+"""Warm JVM shared by Python processes."""
+import argparse
+import os
+import socket
+import threading
+import uuid
+from typing import Any, Iterable, List, Tuple
+
+from py4j.java_gateway import (
+    GatewayParameters,
+    JavaGateway,
+    JavaObject,
+    launch_gateway,
+)
+
+from .dependencies import _CLASS_PATH
+
+# Address of the daemon estimators attach to, as ``port`` or ``host:port``.
+_DEFAULT_DAEMON = os.environ.get("PYMOA_JVM_DAEMON")
+
+_DEFAULT_PORT = 25335
+
+# Directory of the files holding the daemons' auth tokens, readable by their owner only.
+_TOKEN_DIR = os.environ.get("PYMOA_JVM_DAEMON_DIR", os.path.join(os.path.expanduser("~"), ".pymoa"))
+# Token used instead of the token file, e.g. when attaching from another user.
+_TOKEN_ENV = "PYMOA_JVM_DAEMON_TOKEN"
+
+# Classes loaded when the daemon starts, so clients skip cold class loading.
+_WARM_CLASSES = [
+    "com.yahoo.labs.samoa.instances.DenseInstance",
+    "com.yahoo.labs.samoa.instances.SparseInstance",
+    "com.yahoo.labs.samoa.instances.InstancesHeader",
+    "moa.cluster.Clustering",
+    "moa.cluster.SphereCluster",
+    "moa.clusterers.KMeans",
+    "moa.clusterers.clustream.WithKmeans",
+    "moa.clusterers.clustree.ClusTree",
+    "moa.clusterers.denstream.WithDBSCAN",
+    "moa.clusterers.dstream.Dstream",
+    "moa.clusterers.streamkm.StreamKM",
+    "moa.evaluation.CMM",
+    "moa.gui.visualization.DataPoint",
+]
+
+# JVM system properties holding the namespaces of all clients, shared through
+# the daemon: namespace -> {object id -> object} and namespace -> last heartbeat.
+_NAMESPACES_PROPERTY = "pymoa.daemon.namespaces"
+_HEARTBEATS_PROPERTY = "pymoa.daemon.heartbeats"
+
+
+def set_default_daemon(address: str) -> None:
+    """
+    Attach the shared gateway to a daemon instead of launching a JVM.
+
+    It applies the next time the shared gateway is launched.
+
+    :param address: ``port`` or ``host:port`` of the daemon, None to stop attaching.
+    """
+    global _DEFAULT_DAEMON
+    _DEFAULT_DAEMON = None if address is None else str(address)
+
+
+def get_default_daemon() -> str:
+    return _DEFAULT_DAEMON
+
+
+def parse_address(address: Any) -> Tuple[str, int]:
+    """Split a daemon address into host and port."""
+    host, _, port = str(address).rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def token_path(port: int) -> str:
+    """Path of the file holding the auth token of the daemon on a port."""
+    return os.path.join(_TOKEN_DIR, f"daemon-{port}.token")
+
+
+def _write_token(port: int, token: str) -> None:
+    os.makedirs(_TOKEN_DIR, mode=0o700, exist_ok=True)
+    path = token_path(port)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    # The mode only applies to new files, tighten an existing one too.
+    os.chmod(path, 0o600)
+    with os.fdopen(fd, "w") as file:
+        file.write(token)
+
+
+def read_token(address: Any) -> str:
+    """
+    Get the auth token of a daemon.
+
+    It comes from the ``PYMOA_JVM_DAEMON_TOKEN`` environment variable, or
+    from the token file written by :func:`start_daemon`.
+    """
+    token = os.environ.get(_TOKEN_ENV)
+    if token:
+        return token
+    _, port = parse_address(address)
+    try:
+        with open(token_path(port)) as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        raise RuntimeError(
+            f"No auth token for the daemon on port {port}, set {_TOKEN_ENV} or start it with start_daemon."
+        ) from None
+
+
+def _gateway_parameters(host: str, port: int, auth_token: str) -> GatewayParameters:
+    return GatewayParameters(
+        address=host,
+        port=port,
+        auth_token=auth_token,
+        auto_convert=True,
+        auto_field=True,
+        eager_load=True,
+    )
+
+
+def _connect(host: str, port: int, auth_token: str) -> JavaGateway:
+    return JavaGateway(gateway_parameters=_gateway_parameters(host, port, auth_token))
+
+
+def is_daemon_running(address: Any = _DEFAULT_PORT) -> bool:
+    """Whether a daemon answers at an address."""
+    host, port = parse_address(address)
+    try:
+        with socket.create_connection((host, port), timeout=1.0):
+            pass
+    except OSError:
+        return False
+    return True
+
+
+def start_daemon(
+    port: int = _DEFAULT_PORT,
+    class_path: str = _CLASS_PATH,
+    java_options: Iterable[str] = (),
+    log_file: str = None,
+    warm_classes: Iterable[str] = _WARM_CLASSES,
+) -> int:
+    """
+    Launch a JVM that outlives this process and load the MOA classes into it.
+
+    Processes then attach to it with :func:`set_default_daemon` or the
+    ``PYMOA_JVM_DAEMON`` environment variable. It only listens on localhost
+    and only accepts clients presenting its auth token, which is written to
+    :func:`token_path`, readable by the current user only.
+
+    :param port: Port to listen on.
+    :param class_path: Classpath of the JVM.
+    :param java_options: Options of the JVM.
+    :param log_file: Optional file receiving the output of the JVM, which
+        the JVM writes itself so it outlives this process.
+    :param warm_classes: Classes to load right away.
+    :return: The port of the daemon.
+    """
+    if is_daemon_running(port):
+        raise RuntimeError(f"Port {port} is already in use.")
+
+    # Standard error goes straight to the file. Standard output is a pipe
+    # py4j reads the port and token from, so it is redirected from the JVM.
+    log_path = os.devnull if log_file is None else os.path.abspath(log_file)
+    with open(log_path, "a") as output:
+        _, auth_token = launch_gateway(
+            port=port,
+            classpath=class_path,
+            javaopts=list(java_options),
+            die_on_exit=False,
+            enable_auth=True,
+            redirect_stderr=output,
+            create_new_process_group=True,
+        )
+    _write_token(port, auth_token)
+
+    gateway = _connect("127.0.0.1", port, auth_token)
+    try:
+        jvm = gateway.jvm
+        jvm.java.lang.System.setOut(
+            jvm.java.io.PrintStream(jvm.java.io.FileOutputStream(log_path, True), True)
+        )
+        for class_name in warm_classes:
+            jvm.java.lang.Class.forName(class_name)
+    finally:
+        gateway.close(keep_callback_server=True)
+    return port
+
+
+def stop_daemon(address: Any = _DEFAULT_PORT) -> None:
+    """Shut a daemon down, releasing every client's objects."""
+    host, port = parse_address(address)
+    _connect(host, port, read_token(address)).shutdown()
+    try:
+        os.remove(token_path(port))
+    except FileNotFoundError:
+        pass
+
+
+class DaemonGateway(JavaGateway):
+    """
+    Gateway attached to a daemon JVM, with its own namespace.
+
+    Java objects handed to :meth:`track` are kept in the client's namespace
+    on the daemon. While the client lives, a heartbeat keeps them; once a
+    namespace has missed heartbeats for ``idle_timeout`` seconds, e.g.
+    because its process died without releasing them, the next client to
+    check reclaims its objects. :meth:`shutdown` only closes the connection.
+    """
+
+    def __init__(
+        self,
+        address: Any,
+        namespace: str = None,
+        idle_timeout: float = 3600.0,
+        auth_token: str = None,
+    ) -> None:
+        """
+        Attach to a daemon.
+
+        :param address: ``port`` or ``host:port`` of the daemon.
+        :param namespace: Name of the client's namespace, unique by default.
+        :param idle_timeout: Seconds without heartbeat after which a
+            namespace is reclaimed.
+        :param auth_token: Auth token of the daemon, see :func:`read_token`
+            for the default.
+        """
+        host, port = parse_address(address)
+        if auth_token is None:
+            auth_token = read_token(address)
+        super().__init__(gateway_parameters=_gateway_parameters(host, port, auth_token))
+        self._namespace = namespace or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._idle_timeout = idle_timeout
+
+        properties = self.jvm.java.lang.System.getProperties()
+        ConcurrentHashMap = self.jvm.java.util.concurrent.ConcurrentHashMap
+        properties.putIfAbsent(_NAMESPACES_PROPERTY, ConcurrentHashMap())
+        properties.putIfAbsent(_HEARTBEATS_PROPERTY, ConcurrentHashMap())
+        self._namespaces = properties.get(_NAMESPACES_PROPERTY)
+        self._heartbeats = properties.get(_HEARTBEATS_PROPERTY)
+        self._namespaces.putIfAbsent(self._namespace, ConcurrentHashMap())
+        self._objects = self._namespaces.get(self._namespace)
+
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat()
+        self._heartbeat_thread = threading.Thread(
+            target=self._run_heartbeat, name="pymoa-daemon-heartbeat", daemon=True
+        )
+        self._heartbeat_thread.start()
+
+    @property
+    def namespace(self) -> str:
+        return self._namespace
+
+    def track(self, java_objects: Iterable[Any]) -> None:
+        """Keep Java objects in the client's namespace."""
+        for java_object in java_objects:
+            if isinstance(java_object, JavaObject):
+                self._objects.put(java_object._target_id, java_object)
+
+    def untrack(self, java_objects: Iterable[Any]) -> None:
+        """Drop Java objects from the client's namespace."""
+        for java_object in java_objects:
+            if isinstance(java_object, JavaObject):
+                self._objects.remove(java_object._target_id)
+
+    def _heartbeat(self) -> None:
+        self._heartbeats.put(self._namespace, self.jvm.java.lang.System.currentTimeMillis())
+        self.reclaim_idle()
+
+    def _run_heartbeat(self) -> None:
+        interval = max(self._idle_timeout / 4, 1.0)
+        while not self._heartbeat_stop.wait(timeout=interval):
+            try:
+                self._heartbeat()
+            except Exception:
+                return
+
+    def reclaim_idle(self) -> List[str]:
+        """
+        Release the objects of every namespace idle for ``idle_timeout``.
+
+        :return: The reclaimed namespaces.
+        """
+        now = self.jvm.java.lang.System.currentTimeMillis()
+        reclaimed = []
+        for namespace in list(self._heartbeats.keySet()):
+            if namespace == self._namespace:
+                continue
+            last = self._heartbeats.get(namespace)
+            if last is None or now - last < self._idle_timeout * 1000:
+                continue
+            # Only one client wins the removal and releases the objects.
+            if not self._heartbeats.remove(namespace, last):
+                continue
+            objects = self._namespaces.remove(namespace)
+            if objects is not None:
+                for target_id in list(objects.keySet()):
+                    self.detach(JavaObject(target_id, self._gateway_client))
+            reclaimed.append(namespace)
+        return reclaimed
+
+    def shutdown(self, raise_exception: bool = False) -> None:
+        """Release the namespace and close the connection, the daemon keeps running."""
+        self._heartbeat_stop.set()
+        try:
+            self._heartbeats.remove(self._namespace)
+            self._namespaces.remove(self._namespace)
+        except Exception:
+            if raise_exception:
+                raise
+        self.close(keep_callback_server=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the pymoa JVM daemon.")
+    parser.add_argument("command", choices=["start", "stop", "status"])
+    parser.add_argument("--port", type=int, default=_DEFAULT_PORT)
+    parser.add_argument("--log-file", default=None)
+    parser.add_argument("--java-option", action="append", default=[])
+    args = parser.parse_args()
+
+    if args.command == "start":
+        start_daemon(port=args.port, java_options=args.java_option, log_file=args.log_file)
+        print(f"pymoa JVM daemon listening on port {args.port}, token in {token_path(args.port)}")
+    elif args.command == "stop":
+        stop_daemon(args.port)
+    else:
+        print("running" if is_daemon_running(args.port) else "stopped")
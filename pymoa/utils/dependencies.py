@@ -1,3 +1,5 @@
+import os
+
 _MOA_JARS = [
     'weka-dev-3.9.6',
     'native_ref-java-1.1',
@@ -53,4 +55,22 @@ _MOA_JARS = [
     'scalatest-maven-plugin-1.0-M2'
 ]
 
-_CLASS_PATH = ':'.join([f'java/{jar}.jar' for jar in _MOA_JARS])
+# Jars needed by the MOA stream clusterers wrapped in ``pymoa.models.clustering``.
+# ``moa`` bundles samoa instances and javacliparser, ``sizeofag`` backs
+# ``measureByteSize`` and ``jama`` rescales quantized blocks, see
+# ``BaseClustering.set_wire_dtype``.
+_CLUSTERING_JARS = [
+    'moa',
+    'sizeofag-1.0.4',
+    'jama-1.0.3',
+]
+
+_JAVA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'java')
+
+
+def get_class_path(jars):
+    """Build a classpath from jar names found in the ``java`` directory."""
+    return os.pathsep.join([os.path.join(_JAVA_DIR, f'{jar}.jar') for jar in jars])
+
+
+_CLASS_PATH = get_class_path(_CLUSTERING_JARS)
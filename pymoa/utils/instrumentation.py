@@ -0,0 +1,80 @@
+"""Hot-path instrumentation."""
+import bisect
+import threading
+from typing import Any, Callable, Dict, List
+
+# Upper bounds, in seconds, of the latency histogram buckets: 1us to 100s in
+# half-decade steps. The last bucket collects everything above.
+_BUCKET_BOUNDS: List[float] = [1e-6 * 10 ** (i / 2) for i in range(17)]
+
+
+class Instrumentation:
+    """Counters and latency histograms for named events."""
+
+    def __init__(self, callback: Callable[[str, float, int], None] = None) -> None:
+        """
+        Initialize instrumentation.
+
+        :param callback: Optional hook called as ``callback(event, seconds, count)``
+            every time an event is recorded.
+        """
+        self._callback = callback
+        self._lock = threading.Lock()
+        self._events: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def callback(self) -> Callable[[str, float, int], None]:
+        return self._callback
+
+    def record(self, event: str, seconds: float, count: int = 1) -> None:
+        """
+        Record one occurrence of an event.
+
+        :param event: Event name.
+        :param seconds: Latency of the occurrence.
+        :param count: Number of items, e.g. instances, it covered.
+        """
+        with self._lock:
+            stats = self._events.get(event)
+            if stats is None:
+                stats = {
+                    "calls": 0,
+                    "count": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "histogram": [0] * (len(_BUCKET_BOUNDS) + 1),
+                }
+                self._events[event] = stats
+
+            stats["calls"] += 1
+            stats["count"] += count
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["histogram"][bisect.bisect_left(_BUCKET_BOUNDS, seconds)] += 1
+
+        if self._callback is not None:
+            self._callback(event, seconds, count)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get a copy of the recorded statistics.
+
+        Every event maps to the number of ``calls``, the number of items
+        (``count``), the ``total``, ``mean`` and ``max`` latency in seconds,
+        and a ``histogram`` of call latencies over ``bucket_bounds``.
+        """
+        with self._lock:
+            result = {}
+            for event, stats in self._events.items():
+                result[event] = dict(
+                    stats,
+                    mean=stats["total"] / stats["calls"],
+                    histogram=list(stats["histogram"]),
+                    bucket_bounds=list(_BUCKET_BOUNDS),
+                )
+            return result
+
+    def reset(self) -> None:
+        """Drop all recorded statistics."""
+        with self._lock:
+            self._events = {}
@@ -1,55 +1,163 @@
 """Utils."""
+import atexit
 import logging
-from typing import List
+import os
+import threading
+from typing import Any, Iterable, List, Set
 
 from py4j.java_gateway import (
     GatewayParameters,
     JavaGateway,
     launch_gateway,
-    java_import,
 )
 
-from .dependencies import _CLASS_PATH
+from .bridge import JPypeGateway, check_backend, java_import
+from .daemon import DaemonGateway, get_default_daemon
+from .dependencies import _CLASS_PATH, _CLUSTERING_JARS, get_class_path
 
+_LOGGER = logging.getLogger(__name__)
 
-def setup_logger(name: str, level) -> logging.Logger:
-    """Create a logger."""
+
+def setup_logger(name: str, level, log_file: str = None) -> logging.Logger:
+    """
+    Configure a logger with a stream handler and an optional file handler.
+
+    Calling it again for the same logger does not add duplicate handlers.
+
+    :param name: Logger name.
+    :param level: Logging level.
+    :param log_file: Optional path of a log file.
+    """
     logger = logging.getLogger(name)
     logger.setLevel(level)
 
-    file_handler = logging.FileHandler(f"{name}.log")
-    stream_handler = logging.StreamHandler()
-
     formatter = logging.Formatter(
         f"%(asctime)s [{name}] [%(levelname)-5.5s]  %(message)s"
     )
 
-    file_handler.setLevel(level)
-    stream_handler.setLevel(level)
-
-    stream_handler.setFormatter(formatter)
-    file_handler.setFormatter(formatter)
+    handlers = []
+    if not any(type(handler) is logging.StreamHandler for handler in logger.handlers):
+        handlers.append(logging.StreamHandler())
+    if log_file is not None and not any(
+        isinstance(handler, logging.FileHandler)
+        and handler.baseFilename == os.path.abspath(log_file)
+        for handler in logger.handlers
+    ):
+        handlers.append(logging.FileHandler(log_file))
 
-    logger.addHandler(file_handler)
-    logger.addHandler(stream_handler)
+    for handler in handlers:
+        handler.setLevel(level)
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
 
     return logger
 
 
-def setup_java_gateway(imports: List[str]):
+# Garbage collectors selectable by name in :func:`build_java_options`.
+_GARBAGE_COLLECTORS = {
+    "serial": "-XX:+UseSerialGC",
+    "parallel": "-XX:+UseParallelGC",
+    "g1": "-XX:+UseG1GC",
+    "zgc": "-XX:+UseZGC",
+    "shenandoah": "-XX:+UseShenandoahGC",
+}
+
+# JVM options used when none are given, see :func:`set_default_java_options`.
+_DEFAULT_JAVA_OPTIONS: List[str] = []
+
+
+def build_java_options(
+    max_heap: str = None,
+    initial_heap: str = None,
+    gc: str = None,
+    jit_options: Iterable[str] = (),
+    options: Iterable[str] = (),
+    debug_port: int = None,
+) -> List[str]:
+    """
+    Build the command line options of a JVM.
+
+    :param max_heap: Maximum heap size, e.g. ``"8g"``.
+    :param initial_heap: Initial heap size, e.g. ``"2g"``.
+    :param gc: Garbage collector, one of ``"serial"``, ``"parallel"``,
+        ``"g1"``, ``"zgc"`` or ``"shenandoah"``.
+    :param jit_options: JIT flags, e.g. ``["-XX:TieredStopAtLevel=1"]``.
+    :param options: Any other options, passed as is.
+    :param debug_port: Port of a JDWP debugger agent to listen on.
+    """
+    java_options = []
+    if initial_heap is not None:
+        java_options.append(f"-Xms{initial_heap}")
+    if max_heap is not None:
+        java_options.append(f"-Xmx{max_heap}")
+    if gc is not None:
+        if gc not in _GARBAGE_COLLECTORS:
+            raise ValueError(f"gc must be one of {sorted(_GARBAGE_COLLECTORS)}, got {gc!r}.")
+        java_options.append(_GARBAGE_COLLECTORS[gc])
+    java_options.extend(jit_options)
+    java_options.extend(options)
+    if debug_port is not None:
+        java_options.append(f"-agentlib:jdwp=transport=dt_socket,server=y,suspend=n,address={debug_port}")
+    return java_options
+
+
+def set_default_java_options(java_options: Iterable[str]) -> None:
+    """
+    Set the options of the JVMs launched without explicit ones.
+
+    It applies the next time the shared gateway is launched.
+
+    :param java_options: Options, see :func:`build_java_options`.
+    """
+    global _DEFAULT_JAVA_OPTIONS
+    _DEFAULT_JAVA_OPTIONS = list(java_options)
+
+
+def setup_java_gateway(
+    imports: List[str],
+    class_path: str = _CLASS_PATH,
+    backend: str = None,
+    daemon: str = None,
+    java_options: Iterable[str] = None,
+):
     """
-    Launch java gateway.
+    Launch java gateway, or attach to a running daemon.
 
     :param imports: List of fully qualified class paths to import.
+    :param class_path: Classpath of the launched JVM.
+    :param backend: ``"py4j"`` for a JVM process reached over a socket,
+        ``"jpype"`` for a JVM hosted in-process, see
+        :class:`pymoa.utils.bridge.JPypeGateway`. Defaults to
+        :func:`pymoa.utils.bridge.set_default_backend`'s choice.
+    :param daemon: ``port`` or ``host:port`` of a JVM started with
+        :func:`pymoa.utils.daemon.start_daemon` to attach to instead of
+        launching one. Defaults to
+        :func:`pymoa.utils.daemon.set_default_daemon`'s choice.
+    :param java_options: Options of the launched JVM, see
+        :func:`build_java_options`. Defaults to
+        :func:`set_default_java_options`'s choice. A daemon keeps the
+        options it was started with.
     """
-    java_options = [
-        "-Xdebug",
-        "-Xrunjdwp:transport=dt_socket",
-        "suspend=n",
-        "server=y",
-        "address=5005",
-    ]
-    port = launch_gateway(port=0, classpath=_CLASS_PATH, die_on_exit=True)
+    if java_options is None:
+        java_options = _DEFAULT_JAVA_OPTIONS
+    java_options = list(java_options)
+
+    if check_backend(backend) == "jpype":
+        gateway = JPypeGateway(class_path, java_options=java_options)
+        for import_ in imports:
+            java_import(gateway, import_)
+        return gateway
+
+    daemon = daemon or get_default_daemon()
+    if daemon is not None:
+        gateway = DaemonGateway(daemon)
+        for import_ in imports:
+            java_import(gateway, import_)
+        return gateway
+
+    port = launch_gateway(
+        port=0, classpath=class_path, javaopts=java_options, die_on_exit=True
+    )
 
     params = GatewayParameters(
         port=port, auto_convert=True, auto_field=True, eager_load=True
@@ -58,6 +166,191 @@ def setup_java_gateway(imports: List[str]):
     gateway = JavaGateway(gateway_parameters=params)
 
     for import_ in imports:
-        java_import(gateway.jvm, import_)
+        java_import(gateway, import_)
 
     return gateway
+
+
+_GATEWAY_LOCK = threading.RLock()
+_GATEWAY: JavaGateway = None
+_GATEWAY_REFS = 0
+_GATEWAY_IMPORTS: Set[str] = set()
+_GATEWAY_JARS: Set[str] = set()
+_GATEWAY_BACKEND: str = None
+_GATEWAY_JAVA_OPTIONS: List[str] = None
+# Seconds the shared JVM is kept once no estimator uses it, None to keep it
+# until the process exits or :func:`shutdown_java_gateway` is called.
+_GATEWAY_IDLE_TIMEOUT: float = None
+_GATEWAY_IDLE_TIMER: threading.Timer = None
+
+
+def set_java_gateway_idle_timeout(seconds: float) -> None:
+    """
+    Shut the shared JVM down once it has been unused for a while.
+
+    By default it is kept until the process exits, so estimators created one
+    after the other, e.g. the clones of a grid search, reuse the same JVM.
+
+    :param seconds: Idle time before shutdown, None to keep it until exit.
+    """
+    global _GATEWAY_IDLE_TIMEOUT
+    if seconds is not None and seconds < 0:
+        raise ValueError(f"seconds must be non-negative, got {seconds}.")
+    with _GATEWAY_LOCK:
+        _GATEWAY_IDLE_TIMEOUT = seconds
+        if _GATEWAY is not None and _GATEWAY_REFS == 0:
+            _schedule_idle_shutdown()
+
+
+def _cancel_idle_shutdown() -> None:
+    global _GATEWAY_IDLE_TIMER
+    if _GATEWAY_IDLE_TIMER is not None:
+        _GATEWAY_IDLE_TIMER.cancel()
+        _GATEWAY_IDLE_TIMER = None
+
+
+def _schedule_idle_shutdown() -> None:
+    global _GATEWAY_IDLE_TIMER
+    _cancel_idle_shutdown()
+    if _GATEWAY_IDLE_TIMEOUT is not None:
+        _GATEWAY_IDLE_TIMER = threading.Timer(_GATEWAY_IDLE_TIMEOUT, _shutdown_idle_gateway)
+        _GATEWAY_IDLE_TIMER.daemon = True
+        _GATEWAY_IDLE_TIMER.start()
+
+
+def _shutdown_idle_gateway() -> None:
+    with _GATEWAY_LOCK:
+        if _GATEWAY_REFS == 0:
+            shutdown_java_gateway()
+
+
+def shutdown_java_gateway(force: bool = False) -> bool:
+    """
+    Shut the shared JVM down.
+
+    :param force: Shut it down even while estimators still use it, they then
+        fail on their next Java call.
+    :return: Whether a JVM was shut down.
+    """
+    global _GATEWAY, _GATEWAY_REFS
+
+    with _GATEWAY_LOCK:
+        if _GATEWAY is None or (_GATEWAY_REFS > 0 and not force):
+            return False
+        _cancel_idle_shutdown()
+        gateway = _GATEWAY
+        _GATEWAY = None
+        _GATEWAY_REFS = 0
+        _GATEWAY_IMPORTS.clear()
+        _GATEWAY_JARS.clear()
+    gateway.shutdown()
+    return True
+
+
+def get_java_gateway() -> JavaGateway:
+    """Get the shared java gateway, None when no JVM runs."""
+    return _GATEWAY
+
+
+atexit.register(shutdown_java_gateway, force=True)
+
+
+def acquire_java_gateway(
+    imports: List[str],
+    jars: List[str] = _CLUSTERING_JARS,
+    backend: str = None,
+    java_options: Iterable[str] = None,
+) -> JavaGateway:
+    """
+    Get the java gateway shared by all estimators of the process.
+
+    The JVM is launched on first use and every later call only adds the
+    imports it has not seen yet. Each call must be paired with
+    :func:`release_java_gateway`.
+
+    :param imports: List of fully qualified class paths to import.
+    :param jars: Names of the jars, in the ``java`` directory, the caller needs.
+    :param backend: Bridge the caller needs, any running one when omitted,
+        see :func:`setup_java_gateway`.
+    :param java_options: Options the JVM is launched with, when this call
+        launches it. A running JVM keeps its options.
+    """
+    global _GATEWAY, _GATEWAY_REFS, _GATEWAY_BACKEND, _GATEWAY_JAVA_OPTIONS
+
+    if java_options is not None:
+        java_options = list(java_options)
+
+    with _GATEWAY_LOCK:
+        _cancel_idle_shutdown()
+        if _GATEWAY is None:
+            _GATEWAY_BACKEND = check_backend(backend)
+            _GATEWAY = setup_java_gateway(
+                imports=[],
+                class_path=get_class_path(jars),
+                backend=_GATEWAY_BACKEND,
+                java_options=java_options,
+            )
+            _GATEWAY_IMPORTS.clear()
+            _GATEWAY_JARS.clear()
+            _GATEWAY_JARS.update(jars)
+            _GATEWAY_JAVA_OPTIONS = list(_DEFAULT_JAVA_OPTIONS) if java_options is None else java_options
+        elif java_options is not None and java_options != _GATEWAY_JAVA_OPTIONS:
+            _LOGGER.warning(
+                "The shared JVM is already running, ignoring java options %s.", java_options
+            )
+
+        if backend is not None and check_backend(backend) != _GATEWAY_BACKEND:
+            raise RuntimeError(f"The shared JVM runs on the {_GATEWAY_BACKEND} bridge, not {backend}.")
+
+        missing_jars = set(jars) - _GATEWAY_JARS
+        if missing_jars:
+            raise RuntimeError(
+                f"The shared JVM was started without {sorted(missing_jars)} on its classpath."
+            )
+
+        for import_ in imports:
+            if import_ not in _GATEWAY_IMPORTS:
+                java_import(_GATEWAY, import_)
+                _GATEWAY_IMPORTS.add(import_)
+
+        _GATEWAY_REFS += 1
+        return _GATEWAY
+
+
+def track_java_objects(gateway: JavaGateway, java_objects: Iterable[Any]) -> None:
+    """
+    Register long-lived Java objects of an estimator with the gateway.
+
+    On a daemon they are kept in the process's namespace, so they can be
+    reclaimed if the process dies without releasing them.
+    """
+    if isinstance(gateway, DaemonGateway):
+        gateway.track(java_objects)
+
+
+def release_java_gateway(gateway: JavaGateway, java_objects: Iterable[Any] = ()) -> None:
+    """
+    Release a reference taken with :func:`acquire_java_gateway`.
+
+    The given Java objects are detached so the JVM can collect them. Once the
+    last reference is released, the JVM keeps running for the next estimator,
+    see :func:`set_java_gateway_idle_timeout` and :func:`shutdown_java_gateway`.
+
+    :param gateway: Gateway returned by :func:`acquire_java_gateway`.
+    :param java_objects: Java objects owned by the releasing estimator.
+    """
+    global _GATEWAY_REFS
+
+    with _GATEWAY_LOCK:
+        if gateway is not _GATEWAY:
+            return
+
+        if isinstance(gateway, DaemonGateway):
+            gateway.untrack(java_objects)
+        for java_object in java_objects:
+            if java_object is not None:
+                gateway.detach(java_object)
+
+        _GATEWAY_REFS = max(_GATEWAY_REFS - 1, 0)
+        if _GATEWAY_REFS == 0:
+            _schedule_idle_shutdown()